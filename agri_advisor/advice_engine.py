@@ -1,13 +1,33 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, replace
+from datetime import datetime
 from pathlib import Path
-import langid
+import asyncio
+import re
+import threading
+import time
 
-from .retriever import LocalRetriever
-from .rules import when_to_irrigate, parse_weather, parse_soil
-from .config import INDEX_DIR
+from .data_ingestion import DATASETS
+from .lang import detect_language, load_langid
+from .pests import PEST_RULES_FILE
+from .prices import PRICES_FILE, PriceStore, describe
+from .retriever import LocalRetriever, index_version
+from .rules import when_to_irrigate
+from .store import RulesDataStore
+from .cache import TTLCache
+from .metrics import ASK_SECONDS, CACHE_REQUESTS, RETRIEVED_DOCS, STALE_FORECASTS, WEATHER_FALLBACKS, StageTimer
+from .config import INDEX_DIR, RETRIEVAL_BACKEND, RETRIEVAL_SCORING, RAINFALL_WINDOW_DAYS, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_S, BATCH_CONCURRENCY
+from .config import PEST_FEED_LIMIT, PRICE_MAX_SERIES, PRICE_STEADY_PCT
+from .text import tokenize
 from . import external
+from .prefetch import ForecastPrefetcher
+
+# English words are matched as tokens, Hindi ones as substrings (like the irrigation check).
+# "rate" alone is too broad ("seed rate"), so it counts only as "market rate" or "rate of X".
+PRICE_WORDS = {"price", "prices", "mandi", "bhav"}
+PRICE_PHRASE = re.compile(r"\bmarket\s+rates?\b|(?<!seed\s)(?<!sowing\s)\brates?\s+of\b")
+PRICE_WORDS_HI = ("भाव", "दाम", "कीमत", "मंडी")
 
 @dataclass
 class AdvisorResult:
@@ -20,64 +40,442 @@ class AdvisorResult:
 
 
 class AgriAdvisor:
-    def __init__(self, data_dir: Path):
-        self.retriever = LocalRetriever(INDEX_DIR)
+    def __init__(self, data_dir: Path, backend: str = RETRIEVAL_BACKEND,
+                 client: Optional[external.AsyncExternalClient] = None,
+                 prefetcher: Optional[ForecastPrefetcher] = None, index_dir: Path = INDEX_DIR,
+                 scoring: str = RETRIEVAL_SCORING):
+        # The index is opened on first use (or by warm_up) so constructing an advisor is cheap
+        self.index_dir = Path(index_dir)
+        self.backend = backend
+        self.scoring = scoring
+        self._retriever: Optional[LocalRetriever] = None
+        self.startup_timings: Dict[str, float] = {}
         self.data_dir = Path(data_dir)
+        self.store = RulesDataStore(self.data_dir)
+        self.external = client or external.AsyncExternalClient()
+        self.prefetcher = prefetcher
+        self.answers = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_S)
+        self._answers_version: Any = None
+        self._prices: Optional[PriceStore] = None
+        self._prices_version: Any = None
+        self._reload_lock = threading.Lock()
+        self._pest_feed = None
+        # workers.AnswerPool doing prepare() and the irrigation rules when set (server "pool" mode)
+        self.pool = None
+
+    @property
+    def retriever(self) -> LocalRetriever:
+        if self._retriever is None:
+            t0 = time.perf_counter()
+            self._retriever = LocalRetriever(self.index_dir, backend=self.backend, scoring=self.scoring)
+            self.startup_timings["index_open_ms"] = (time.perf_counter() - t0) * 1000
+        return self._retriever
+
+    def reload_index(self) -> bool:
+        # Open the published index if it is not the one being served, warm it, then swap
+        # it in with one assignment. Requests that already hold the old retriever finish
+        # on it; its mapped files are released with the last reference. Cached answers
+        # are dropped at the swap (see _cached).
+        with self._reload_lock:
+            if self._retriever is not None and self._retriever.loaded_version == index_version(self.index_dir):
+                return False
+            t0 = time.perf_counter()
+            retriever = LocalRetriever(self.index_dir, backend=self.backend, scoring=self.scoring)
+            retriever.retrieve("warm up")
+            self._retriever = retriever
+            self.startup_timings["index_reload_ms"] = (time.perf_counter() - t0) * 1000
+            return True
+
+    @property
+    def prices(self) -> Optional[PriceStore]:
+        # prices.bin of the index version being served, reopened when that changes; None without one
+        path = self.retriever.index_dir / PRICES_FILE
+        try:
+            st = path.stat()
+            version: Any = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            version = None
+        if version != self._prices_version:
+            self._prices = PriceStore(path) if version is not None else None
+            self._prices_version = version
+        return self._prices
+
+    def warm_up(self, langid: bool = True) -> Dict[str, float]:
+        # Pay the lazy loading costs up front, e.g. before a server starts taking traffic
+        t0 = time.perf_counter()
+        self.retriever.retrieve("warm up")
+        t1 = time.perf_counter()
+        self.store.districts()
+        t2 = time.perf_counter()
+        self.startup_timings["store_load_ms"] = (t2 - t1) * 1000
+        if langid:
+            load_langid().classify("warm up")
+            self.startup_timings["langid_load_ms"] = (time.perf_counter() - t2) * 1000
+        self.startup_timings["warm_up_ms"] = (time.perf_counter() - t0) * 1000
+        return dict(self.startup_timings)
+
+    def ask(self, question: str, district: str | None = None, crop: str | None = None, lang: str = "en",
+            timings: bool = False) -> AdvisorResult:
+        # timings=True adds per-stage wall-clock times (ms) as debug["timings_ms"]
+        timer = StageTimer()
+        key = self._cache_key(question, district, crop, lang)
+        with timer.stage("cache"):
+            cached = self._cached(key)
+        if cached is not None:
+            return self._finish(cached, timer, "cached", timings)
+        res, hits = self.prepare(question, district, crop, lang, timer)
+        if res is not None:
+            return self._finish(self._store(key, res), timer, "prices", timings)
+        docs, citations = hits
+        if not self._is_irrigation(question):
+            return self._finish(self._store(key, self._retrieval_answer(docs, citations)), timer, "retrieval", timings)
+        # Try public APIs first
+        daily = None
+        if district:
+            try:
+                with timer.stage("geocode"):
+                    loc = external.geocode_district(district)
+                if loc:
+                    with timer.stage("forecast"):
+                        daily = external.fetch_open_meteo(*loc)
+            except Exception:
+                daily = None
+        res = self._store(key, self._irrigation_answer(district, daily, docs, citations, timer=timer))
+        return self._finish(res, timer, "irrigation", timings)
+
+    async def ask_async(self, question: str, district: str | None = None, crop: str | None = None, lang: str = "en",
+                        timings: bool = False) -> AdvisorResult:
+        # Same as ask, but the geocode/forecast lookups go through the shared pooled client
+        timer = StageTimer()
+        key = self._cache_key(question, district, crop, lang)
+        with timer.stage("cache"):
+            cached = self._cached(key)
+        if cached is not None:
+            return self._finish(cached, timer, "cached", timings)
+        res, hits = await self._prepare(question, district, crop, lang, timer)
+        if res is not None:
+            return self._finish(self._store(key, res), timer, "prices", timings)
+        docs, citations = hits
+        if not self._is_irrigation(question):
+            return self._finish(self._store(key, self._retrieval_answer(docs, citations)), timer, "retrieval", timings)
+        daily, stale = await self._forecast(district, timer)
+        res = self._store(key, await self._irrigation(district, daily, docs, citations, stale, timer))
+        return self._finish(res, timer, "irrigation", timings)
+
+    async def ask_stream(self, question: str, district: str | None = None, crop: str | None = None, lang: str = "en",
+                         timings: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        # ask_async in stages, as (event, payload) pairs: "hits" as soon as retrieval is done,
+        # "answer" once the forecast (or the local-CSV fallback) is in, then "followups"
+        timer = StageTimer()
+        key = self._cache_key(question, district, crop, lang)
+        with timer.stage("cache"):
+            res = self._cached(key)
+        if res is not None:
+            res = self._finish(res, timer, "cached", timings)
+            yield "hits", {"hits": res.debug.get("hits", []), "citations": res.citations}
+        else:
+            res, hits = await self._prepare(question, district, crop, lang, timer)
+            if res is not None:
+                res = self._finish(self._store(key, res), timer, "prices", timings)
+                yield "hits", {"hits": [], "citations": res.citations}
+            else:
+                docs, citations = hits
+                yield "hits", {"hits": docs[:3], "citations": list(citations)}
+                if not self._is_irrigation(question):
+                    res = self._finish(self._store(key, self._retrieval_answer(docs, citations)), timer, "retrieval",
+                                       timings)
+                else:
+                    daily, stale = await self._forecast(district, timer)
+                    res = self._store(key, await self._irrigation(district, daily, docs, citations, stale, timer))
+                    res = self._finish(res, timer, "irrigation", timings)
+        yield "answer", {"answer": res.answer, "confidence": res.confidence, "reasons": res.reasons,
+                         "citations": res.citations, "debug": res.debug}
+        yield "followups", {"followups": res.followups}
+
+    async def ask_many_async(self, items: List[Tuple[str, Optional[str], Optional[str], str]],
+                             concurrency: int = BATCH_CONCURRENCY) -> List[AdvisorResult]:
+        # items are (question, district, crop, lang). Cached and repeated questions are
+        # answered once, retrieval runs as one retrieve_many call, and forecast lookups
+        # run concurrently with at most `concurrency` in flight.
+        batch_timer = StageTimer()
+        keys = [self._cache_key(*item) for item in items]
+        results: List[Optional[AdvisorResult]] = [self._cached(key) for key in keys]
+        unique: Dict[Any, int] = {}
+        for i, key in enumerate(keys):
+            if results[i] is None and key not in unique:
+                unique[key] = i
+        todo = list(unique.values())
+        prepared = await self._prepare_many([items[i] for i in todo], batch_timer) if todo else []
+        doc_lists: Dict[int, List[Dict[str, Any]]] = {}
+        for i, (res, docs) in zip(todo, prepared):
+            if res is not None:
+                results[i] = self._store(keys[i], res)
+            else:
+                doc_lists[i] = docs
+        todo = [i for i in todo if i in doc_lists]
+        sem = asyncio.Semaphore(concurrency)
+
+        async def finish(i: int, docs: List[Dict[str, Any]]) -> AdvisorResult:
+            question, district, _, _ = items[i]
+            timer = StageTimer()
+            RETRIEVED_DOCS.observe(len(docs))
+            citations = self._citations(docs)
+            if not self._is_irrigation(question):
+                return self._store(keys[i], self._retrieval_answer(docs, citations))
+            async with sem:
+                daily, stale = await self._forecast(district, timer)
+            return self._store(keys[i], await self._irrigation(district, daily, docs, citations, stale, timer))
+
+        answers = await asyncio.gather(*(finish(i, doc_lists[i]) for i in todo))
+        by_key = {keys[i]: res for i, res in zip(todo, answers)}
+        by_key.update((keys[i], results[i]) for i in unique.values() if results[i] is not None)
+        # Answers of a batch are all returned when it is done, so the batch is observed once
+        ASK_SECONDS.observe(batch_timer.elapsed(), path="batch")
+        return [res if res is not None else by_key[key] for res, key in zip(results, keys)]
+
+    def prepare(self, question: str, district: str | None, crop: str | None, lang: str,
+                timer: StageTimer) -> Tuple[Optional[AdvisorResult], Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]]:
+        # The CPU-bound first step of an answer: (price answer, None) when the price store
+        # answers it, else (None, (retrieved docs, citations))
+        res = self._price_answer(question, district, crop, timer)
+        if res is not None:
+            return res, None
+        return None, self._retrieve(question, district, crop, lang, timer)
+
+    def prepare_many(self, items: List[Tuple[str, Optional[str], Optional[str], str]],
+                     timer: StageTimer) -> List[Tuple[Optional[AdvisorResult], Optional[List[Dict[str, Any]]]]]:
+        # prepare() for a batch of (question, district, crop, lang): per item (price answer,
+        # None) or (None, retrieved docs). Questions sharing a district/crop share a filter
+        # set, so they retrieve as one retrieve_many call.
+        out: List[Tuple[Optional[AdvisorResult], Optional[List[Dict[str, Any]]]]] = [(None, None)] * len(items)
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for i, (question, district, crop, _) in enumerate(items):
+            res = self._price_answer(question, district, crop, timer)
+            if res is not None:
+                out[i] = (res, None)
+            else:
+                groups.setdefault((district or "", crop or ""), []).append(i)
+        with timer.stage("retrieval_batch"):
+            for (district, crop), idxs in groups.items():
+                queries = [self._augment_query(*items[i][:3]) for i in idxs]
+                filters = self._filters(district or None, crop or None)
+                for i, docs in zip(idxs, self.retriever.retrieve_many(queries, filters=filters)):
+                    out[i] = (None, docs)
+        return out
+
+    async def _prepare(self, question: str, district: str | None, crop: str | None, lang: str, timer: StageTimer):
+        if self.pool is None:
+            return self.prepare(question, district, crop, lang, timer)
+        res, hits, stages = await self.pool.prepare(question, district, crop, lang)
+        timer.merge(stages)
+        if hits is not None:
+            RETRIEVED_DOCS.observe(len(hits[0]))
+        return res, hits
+
+    async def _prepare_many(self, items: List[Tuple[str, Optional[str], Optional[str], str]], timer: StageTimer):
+        if self.pool is None:
+            return self.prepare_many(items, timer)
+        prepared, stages = await self.pool.prepare_many(items)
+        timer.merge(stages)
+        return prepared
+
+    async def _irrigation(self, district: str | None, daily: Optional[List[Dict[str, Any]]],
+                          docs: List[Dict[str, Any]], citations: List[Dict[str, Any]], stale: bool,
+                          timer: StageTimer) -> AdvisorResult:
+        if self.pool is None:
+            return self._irrigation_answer(district, daily, docs, citations, stale, timer)
+        res, stages = await self.pool.irrigation_answer(district, daily, docs, citations, stale)
+        timer.merge(stages)
+        return res
 
-    def ask(self, question: str, district: str | None = None, crop: str | None = None, lang: str = "en") -> AdvisorResult:
-        lang_detected, _ = langid.classify(question)
-        lang = lang or lang_detected
-        query = self._augment_query(question, district, crop)
-        docs = self.retriever.retrieve(query)
+    async def _forecast(self, district: str | None, timer: StageTimer) -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+        if not district:
+            return None, False
+        try:
+            if self.prefetcher is not None:
+                with timer.stage("forecast"):
+                    return await self.prefetcher.forecast(district)
+            # forecast_for_district, split so geocoding and the forecast are timed apart
+            with timer.stage("geocode"):
+                loc = await self.external.geocode_district(district)
+            if not loc:
+                return None, False
+            with timer.stage("forecast"):
+                return await self.external.fetch_open_meteo(*loc), False
+        except Exception:
+            return None, False
 
-        reasons: List[str] = []
+    def _finish(self, res: AdvisorResult, timer: StageTimer, path: str, timings: bool) -> AdvisorResult:
+        ASK_SECONDS.observe(timer.elapsed(), path=path)
+        if not timings:
+            return res
+        return replace(res, debug={**res.debug, "timings_ms": timer.as_ms()})
+
+    def _cache_key(self, question: str, district: str | None, crop: str | None, lang: str):
+        norm_q = " ".join(question.casefold().split()).strip(" ?!.।")
+        return (norm_q, (district or "").strip().casefold(), (crop or "").strip().casefold(), lang or "")
+
+    def _cached(self, key) -> Optional[AdvisorResult]:
+        # Swapping in a new index or changed weather/soil CSVs drop every cached answer
+        version = (self.retriever.loaded_version, self.store.version)
+        if version != self._answers_version:
+            self.answers.clear()
+            self._answers_version = version
+        res = self.answers.get(key)
+        if res is None:
+            CACHE_REQUESTS.inc(cache="answers", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="answers", result="hit")
+        return replace(res, debug={**res.debug, "cached": True})
+
+    def _store(self, key, res: AdvisorResult) -> AdvisorResult:
+        # Answers built on a stale forecast are served once but not cached
+        if not res.debug.get("forecast_stale"):
+            self.answers.set(key, res)
+        return res
+
+    def irrigation_advisories(self) -> List[Dict[str, Any]]:
+        # Local-data irrigation advisory for every district with weather rows
+        from .advisories import irrigation_advisories
+        return irrigation_advisories(self.store)
+
+    @property
+    def pest_feed(self):
+        # advisories.PestFeed over the served index version's pest rules, built on first use
+        if self._pest_feed is None:
+            from .advisories import PestFeed
+            self._pest_feed = PestFeed(self.store, lambda: self.retriever.index_dir / PEST_RULES_FILE)
+        return self._pest_feed
+
+    def pest_alerts(self, district: str | None = None, crop: str | None = None,
+                    limit: int = PEST_FEED_LIMIT) -> Dict[str, Any]:
+        # Ranked pest alerts whose weather and crop-stage conditions hold on each district's latest day
+        return self.pest_feed.feed(district, crop, limit)
+
+    def _retrieve(self, question: str, district: str | None, crop: str | None, lang: str, timer: StageTimer):
+        with timer.stage("lang_detect"):
+            lang = lang or detect_language(question)
+        with timer.stage("augment"):
+            query = self._augment_query(question, district, crop)
+        with timer.stage("retrieval"):
+            docs = self.retriever.retrieve(query, filters=self._filters(district, crop))
+        RETRIEVED_DOCS.observe(len(docs))
+        return docs, self._citations(docs)
+
+    def _citations(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         citations: List[Dict[str, Any]] = []
         for d in docs:
             citations.append({"source": d.get("__source"), "dataset": d.get("__dataset")})
+        return citations
 
+    def _is_price(self, question: str) -> bool:
+        # Irrigation questions keep their own path even when they mention prices
+        if self._is_irrigation(question):
+            return False
         lower_q = question.lower()
-        if "irrigate" in lower_q or "सिंचाई" in lower_q:
-            # Try public APIs first
-            weather_rows = None
-            if district:
-                try:
-                    # geocode and fetch open-meteo daily forecast
-                    # We run async functions via httpx.run wrappers
-                    loc = external.geocode_district(district)
-                    if loc:
-                        lat, lon = loc
-                        daily = external.fetch_open_meteo(lat, lon)
-                        if daily:
-                            # Convert to rules-compatible rows using most recent 3 days (or next 3 days?)
-                            # For irrigation, use past days would be ideal, but Open-Meteo daily returns forecast.
-                            # We will use first 3 entries as near-term outlook.
-                            from datetime import datetime
-                            parsed = []
-                            for row in daily[:3]:
-                                parsed.append({
-                                    "date": datetime.fromisoformat(row["date"]),
-                                    "rain_mm": row.get("rain_mm", 0.0) or 0.0,
-                                    "tmax_c": row.get("tmax_c"),
-                                })
-                            weather_rows = parsed
-                            citations.append({"source": "Open-Meteo", "dataset": "weather_forecast", "url": "https://api.open-meteo.com/"})
-                            citations.append({"source": "Nominatim OSM", "dataset": "geocoding", "url": "https://nominatim.org/"})
-                except Exception:
-                    weather_rows = None
+        return (bool(PRICE_WORDS.intersection(tokenize(lower_q))) or PRICE_PHRASE.search(lower_q) is not None
+                or any(w in lower_q for w in PRICE_WORDS_HI))
+
+    def _commodity(self, question: str, store: PriceStore) -> Optional[str]:
+        # Longest run of question words (up to three) naming a commodity in the store
+        tokens = tokenize(question)
+        for n in (3, 2, 1):
+            for i in range(len(tokens) - n + 1):
+                name = " ".join(tokens[i:i + n])
+                if store.has_commodity(name):
+                    return name
+        return None
+
+    def _price_answer(self, question: str, district: str | None, crop: str | None,
+                      timer: StageTimer) -> Optional[AdvisorResult]:
+        # Price-trend questions are answered from the precomputed price store; None means
+        # "not a price question we can answer" and the caller goes on to retrieval
+        if not self._is_price(question):
+            return None
+        with timer.stage("prices"):
+            store = self.prices
+            commodity = (crop or self._commodity(question, store)) if store is not None else None
+            if not commodity:
+                return None
+            reasons = ["Computed from 7- and 30-day aggregates of daily mandi modal prices."]
+            sids = store.series(commodity, district) if district else range(0)
+            if not sids:
+                sids = store.series(commodity)
+                if not sids:
+                    return None
+                if district:
+                    reasons.append(f"No {commodity} prices reported for {district}; showing other districts.")
+            trends = [t for t in (store.trend(sid) for sid in sids) if t is not None]
+            if not trends:
+                return None
+            trends.sort(key=lambda t: t.date, reverse=True)
+            if len(trends) > PRICE_MAX_SERIES:
+                reasons.append(f"Showing the {PRICE_MAX_SERIES} most recently reported of {len(trends)} districts.")
+                trends = trends[:PRICE_MAX_SERIES]
+            answer = "\n".join(" ".join(describe(t, PRICE_STEADY_PCT)) for t in trends)
+        # Fewer than a week of prices in the month makes the trend a weak signal
+        confidence = 0.75 if all(t.windows[max(t.windows)]["days"] >= 7 for t in trends) else 0.6
+        citations = [{"source": DATASETS["mandi_prices"]["source"], "dataset": "mandi_prices"}]
+        return AdvisorResult(answer, confidence, reasons, citations, self._followups(),
+                             {"prices": [t.as_dict() for t in trends]})
+
+    def _is_irrigation(self, question: str) -> bool:
+        lower_q = question.lower()
+        return "irrigate" in lower_q or "सिंचाई" in lower_q
+
+    def _irrigation_answer(self, district: str | None, daily: Optional[List[Dict[str, Any]]],
+                           docs: List[Dict[str, Any]], citations: List[Dict[str, Any]],
+                           stale: bool = False, timer: Optional[StageTimer] = None) -> AdvisorResult:
+        timer = timer or StageTimer()
+        weather_rows = None
+        debug: Dict[str, Any] = {"hits": docs[:3]}
+        if daily:
+            # Open-Meteo daily returns forecast; use first 3 entries as near-term outlook
+            try:
+                weather_rows = [{
+                    "date": datetime.fromisoformat(row["date"]),
+                    "rain_mm": row.get("rain_mm", 0.0) or 0.0,
+                    "tmax_c": row.get("tmax_c"),
+                } for row in daily[:3]]
+                forecast = {"source": "Open-Meteo", "dataset": "weather_forecast", "url": "https://api.open-meteo.com/"}
+                if stale:
+                    forecast["note"] = "Last good forecast; a refresh is in progress."
+                    STALE_FORECASTS.inc()
+                citations.append(forecast)
+                citations.append({"source": "Nominatim OSM", "dataset": "geocoding", "url": "https://nominatim.org/"})
+                debug["forecast_stale"] = stale
+            except Exception:
+                weather_rows = None
+        with timer.stage("weather_data"):
             if not weather_rows:
-                weather_rows = parse_weather(self.data_dir / "weather_sample.csv", district)
-            s = parse_soil(self.data_dir / "soil_types.csv", district)
+                WEATHER_FALLBACKS.inc(reason="no_forecast" if district else "no_district")
+                # Only the rainfall window matters to the rule, so fetch just that slice
+                weather_rows = self.store.window(district, RAINFALL_WINDOW_DAYS)
+            s = self.store.soil(district)
+        with timer.stage("rules"):
             rule = when_to_irrigate(weather_rows or [], s)
             answer = reasons_to_answer(rule.messages)
-            conf = rule.confidence
-            reasons.extend(rule.messages)
-            return AdvisorResult(answer, conf, reasons, citations, self._followups(), {"hits": docs[:3]})
+        reasons = list(rule.messages)
+        return AdvisorResult(answer, rule.confidence, reasons, citations, self._followups(), debug)
 
+    def _retrieval_answer(self, docs: List[Dict[str, Any]], citations: List[Dict[str, Any]]) -> AdvisorResult:
         top_texts = [d["__text"] for d in docs[:3]]
         answer = summarize_bullets(top_texts)
-        reasons.extend(["Synthesized from local datasets via TF-IDF retrieval."])
+        reasons = ["Synthesized from local datasets via TF-IDF retrieval."]
         return AdvisorResult(answer, 0.55, reasons, citations, self._followups(), {"hits": docs[:3]})
 
+    def _filters(self, district: str | None, crop: str | None) -> Optional[Dict[str, Any]]:
+        # Rows tied to another district or crop are out of scope; rows without one
+        # (policies, pest advice for the crop, calendars) stay candidates
+        if not (district or crop) or not self.retriever.index.has_fields:
+            return None
+        filters: Dict[str, Any] = {}
+        if district:
+            filters["district"] = {district, None}
+        if crop:
+            filters["crop"] = {crop, None}
+        return filters
+
     def _augment_query(self, question: str, district: str | None, crop: str | None) -> str:
         parts = [question]
         if district:
@@ -106,4 +504,4 @@ def summarize_bullets(texts: List[str]) -> str:
 def reasons_to_answer(messages: List[str]) -> str:
     if not messages:
         return "No specific rule-based insight found."
-    return " ".join(messages)
\ No newline at end of file
+    return " ".join(messages)
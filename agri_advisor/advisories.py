@@ -0,0 +1,263 @@
+from __future__ import annotations
+import asyncio
+import logging
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import PEST_FEED_INTERVAL_S, PEST_FEED_LIMIT, RAINFALL_WINDOW_DAYS
+from .pests import OPS, PestRule, Predicate, load_pest_rules
+from .rules import RuleResult, irrigation_rule
+from .store import RulesDataStore, WeatherSeries
+from .text import field_value
+
+log = logging.getLogger(__name__)
+
+
+def bulk_irrigation(store: RulesDataStore) -> Dict[str, RuleResult]:
+    # when_to_irrigate for every district in one pass: the district series are
+    # concatenated and the window sums/means are grouped with bincount. bincount
+    # accumulates in input order, so the sums equal the per-district Python sums.
+    series = store.all_series()
+    if not series:
+        return {}
+    lengths = np.array([len(s) for s in series], dtype=np.int64)
+    group = np.repeat(np.arange(len(series)), lengths)
+    ordinals = np.concatenate([np.asarray(s.ordinals, dtype=np.int64) for s in series])
+    rain = np.concatenate([np.asarray(s.rain_mm, dtype=np.float64) for s in series])
+    tmax = np.concatenate([np.asarray(s.tmax_c, dtype=np.float64) for s in series])
+
+    # Series are date-sorted, so each group's latest day is its last element
+    latest = ordinals[np.cumsum(lengths) - 1]
+    in_window = ordinals >= (latest - RAINFALL_WINDOW_DAYS)[group]
+    g = group[in_window]
+    rain_sum = np.bincount(g, weights=rain[in_window], minlength=len(series))
+    tmax_sum = np.bincount(g, weights=tmax[in_window], minlength=len(series))
+    counts = np.bincount(g, minlength=len(series))
+
+    out: Dict[str, RuleResult] = {}
+    for i, s in enumerate(series):
+        tmax_mean = float(tmax_sum[i]) / int(counts[i]) if counts[i] else None
+        out[s.district] = irrigation_rule(float(rain_sum[i]), tmax_mean, store.soil(s.district))
+    return out
+
+
+def irrigation_advisories(store: RulesDataStore) -> List[Dict[str, object]]:
+    return [
+        {"district": district, "answer": " ".join(rule.messages), "confidence": rule.confidence, "reasons": rule.messages}
+        for district, rule in bulk_irrigation(store).items()
+    ]
+
+
+def _stage_mask(latest: np.ndarray, sow: str, from_day: int, to_day: int) -> np.ndarray:
+    # Whether each day in latest (datetime64[D]) is from_day..to_day days after the
+    # season's most recent sowing start
+    month, day = (int(x) for x in sow.split("-"))
+    years = latest.astype("datetime64[Y]")
+    starts = (years.astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+    earlier = ((years - 1).astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+    since = (latest - np.where(starts > latest, earlier, starts)).astype(np.int64)
+    return (since >= from_day) & (since <= to_day)
+
+
+class PestAlerts:
+    # Every rule evaluated on each district's latest day of weather. Rules sharing their
+    # predicates, stage window and crop form one group, evaluated once: window aggregates
+    # are bincounts over the concatenated district series (as in advisories.bulk_irrigation),
+    # predicates are array comparisons over districts, and the matching (group, district)
+    # pairs are ranked once so a query only filters and slices them.
+    def __init__(self, rules: Sequence[PestRule], series: Sequence[WeatherSeries]):
+        t0 = time.perf_counter()
+        self.rules = list(rules)
+        self.districts = [s.district for s in series]
+        n = len(series)
+        lengths = np.array([len(s) for s in series], dtype=np.int64)
+        group = np.repeat(np.arange(n), lengths)
+
+        def column(name: str, dtype) -> np.ndarray:
+            return np.concatenate([np.asarray(getattr(s, name), dtype=dtype) for s in series]) if n else np.zeros(0, dtype)
+
+        ordinals = column("ordinals", np.int64)
+        latest = ordinals[np.cumsum(lengths) - 1]
+        # Ordinal 1 is 0001-01-01; numpy days count from 1970-01-01 (ordinal 719163)
+        self.latest = (latest - 719163).astype("datetime64[D]")
+
+        columns: Dict[str, np.ndarray] = {}
+        self.values: Dict[Tuple[str, str, int], np.ndarray] = {}
+
+        def feature(f: str, agg: str, days: int) -> np.ndarray:
+            key = (f, agg, days)
+            if key not in self.values:
+                if f not in columns:
+                    columns[f] = column(f, np.float64)
+                col = columns[f]
+                keep = (ordinals > (latest - days)[group]) & ~np.isnan(col)
+                g = group[keep]
+                total = np.bincount(g, weights=col[keep], minlength=n)
+                count = np.bincount(g, minlength=n)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    value = total / count if agg == "mean" else np.where(count > 0, total, np.nan)
+                self.values[key] = value
+            return self.values[key]
+
+        # Group rules by (predicates, stage window, crop)
+        groups: Dict[Tuple[Any, ...], List[int]] = {}
+        for i, rule in enumerate(self.rules):
+            key = (tuple(rule.predicates), rule.sow, rule.from_day, rule.to_day, field_value("crop", rule.crop))
+            groups.setdefault(key, []).append(i)
+        self.groups = list(groups.values())
+        keys = list(groups)
+        self.group_crop = [key[-1] for key in keys]
+        ok = np.ones((len(keys), n), dtype=bool)
+        score = np.zeros((len(keys), n))
+        conditions: Dict[Tuple[Predicate, ...], Tuple[np.ndarray, np.ndarray]] = {}
+        stages: Dict[Tuple[Any, ...], np.ndarray] = {}
+        for gi, key in enumerate(keys):
+            predicates, sow, from_day, to_day = key[0], key[1], key[2], key[3]
+            if predicates not in conditions:
+                cond_ok = np.ones(n, dtype=bool)
+                margin = np.zeros(n)
+                for p in predicates:
+                    v = feature(p.field, p.agg, p.days)
+                    with np.errstate(invalid="ignore"):
+                        cond_ok &= OPS[p.op](v, p.value)
+                    # How far past its threshold, relative to it and capped at 1
+                    past = (v - p.value) if p.op[0] == ">" else (p.value - v)
+                    margin += np.clip(np.nan_to_num(past / max(abs(p.value), 1.0)), 0.0, 1.0)
+                conditions[predicates] = (cond_ok, margin / len(predicates))
+            cond_ok, cond_score = conditions[predicates]
+            ok[gi] = cond_ok
+            score[gi] = cond_score
+            if sow is not None:
+                if (sow, from_day, to_day) not in stages:
+                    stages[(sow, from_day, to_day)] = _stage_mask(self.latest, sow, from_day, to_day)
+                ok[gi] &= stages[(sow, from_day, to_day)]
+
+        # Matches ranked by score, then district name, then group
+        gi, di = np.nonzero(ok)
+        name_rank = np.empty(n, dtype=np.int64)
+        name_rank[np.argsort(np.array([d.casefold() for d in self.districts], dtype=object), kind="stable")] = np.arange(n)
+        s = score[gi, di]
+        order = np.lexsort((gi, name_rank[di], -s))
+        self.match_group, self.match_district, self.match_score = gi[order], di[order], s[order]
+        self.group_size = np.array([len(g) for g in self.groups], dtype=np.int64)
+        self.evaluated_ms = (time.perf_counter() - t0) * 1000
+
+    def feed(self, district: Optional[str] = None, crop: Optional[str] = None,
+             limit: int = PEST_FEED_LIMIT) -> Dict[str, Any]:
+        # Ranked alerts, optionally for one district and/or crop; "total" counts all matches
+        keep = np.ones(len(self.match_group), dtype=bool)
+        if district:
+            wanted = district.strip().casefold()
+            ids = [i for i, d in enumerate(self.districts) if d.casefold() == wanted]
+            keep &= np.isin(self.match_district, ids)
+        if crop:
+            wanted = field_value("crop", crop)
+            keep &= np.isin(self.match_group, [i for i, c in enumerate(self.group_crop) if c == wanted])
+        groups, districts, scores = self.match_group[keep], self.match_district[keep], self.match_score[keep]
+        alerts: List[Dict[str, Any]] = []
+        for gi, di, score in zip(groups.tolist(), districts.tolist(), scores.tolist()):
+            if len(alerts) >= limit:
+                break
+            for ri in self.groups[gi][:limit - len(alerts)]:
+                rule = self.rules[ri]
+                alerts.append({
+                    "district": self.districts[di],
+                    "crop": rule.crop,
+                    "pest": rule.pest,
+                    "score": round(score, 3),
+                    "as_of": str(self.latest[di]),
+                    "stage": rule.stage,
+                    "matched": [p.describe(float(self.values[(p.field, p.agg, p.days)][di])) for p in rule.predicates],
+                    "conditions": rule.conditions,
+                    "advice": rule.advice,
+                    "source": rule.source,
+                })
+        return {
+            "alerts": alerts,
+            "total": int(self.group_size[groups].sum()),
+            "rules": len(self.rules),
+            "districts": len(self.districts),
+            "evaluated_ms": round(self.evaluated_ms, 1),
+        }
+
+
+class PestFeed:
+    # Pest rules of the served index version evaluated over the weather store, redone
+    # when either changes. refresh() is the scheduled batch pass; feed() reuses its
+    # result and only evaluates itself when nothing current is there yet.
+    def __init__(self, store: RulesDataStore, rules_path: Callable[[], Path]):
+        self.store = store
+        self.rules_path = rules_path
+        self._lock = threading.Lock()
+        self._alerts: Optional[PestAlerts] = None
+        self._version: Any = None
+
+    def _current_version(self) -> Tuple[Any, ...]:
+        path = self.rules_path()
+        try:
+            st = path.stat()
+            rules: Any = (str(path), st.st_mtime_ns, st.st_size)
+        except OSError:
+            rules = None
+        return rules, self.store.version
+
+    @property
+    def alerts(self) -> Optional[PestAlerts]:
+        return self._alerts
+
+    def refresh(self) -> bool:
+        with self._lock:
+            version = self._current_version()
+            if version == self._version:
+                return False
+            rules = load_pest_rules(self.rules_path()) if version[0] is not None else []
+            self._alerts = PestAlerts(rules, self.store.all_series())
+            self._version = version
+            return True
+
+    def feed(self, district: Optional[str] = None, crop: Optional[str] = None,
+             limit: int = PEST_FEED_LIMIT) -> Dict[str, Any]:
+        try:
+            self.refresh()
+        except Exception:
+            if self._alerts is None:
+                raise
+            log.exception("pest alert evaluation failed; serving the previous feed")
+        return self._alerts.feed(district, crop, limit)
+
+
+class PestFeedScheduler:
+    # Re-runs PestFeed.refresh every interval in a worker thread, so the feed endpoint
+    # finds the evaluation already done after weather data or a new index lands
+    def __init__(self, feed: PestFeed, interval: float = PEST_FEED_INTERVAL_S):
+        self.feed = feed
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await asyncio.to_thread(self.feed.refresh):
+                    log.info("pest alerts re-evaluated in %.0f ms", self.feed.alerts.evaluated_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("pest alert evaluation failed; keeping the previous feed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
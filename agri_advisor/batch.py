@@ -0,0 +1,96 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import asdict
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .config import BATCH_SIZE, BATCH_CONCURRENCY
+from .data_models import AskRequest
+
+
+def parse_line(line: str) -> Tuple[Optional[AskRequest], Any, Optional[str]]:
+    # -> (request, id, error); an "id" field is echoed back so callers can join results
+    try:
+        obj = json.loads(line)
+    except ValueError as exc:
+        return None, None, f"invalid JSON: {exc}"
+    if not isinstance(obj, dict):
+        return None, None, "each line must be a JSON object"
+    try:
+        return AskRequest.model_validate(obj), obj.get("id"), None
+    except ValidationError as exc:
+        return None, obj.get("id"), f"invalid request: {exc.errors()[0].get('msg')}"
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Split a byte stream (e.g. a request body) into lines without buffering all of it
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buf:
+        yield buf.decode("utf-8")
+
+
+async def aiter_sync(lines: Iterable[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line
+
+
+async def _chunks(lines: AsyncIterator[str], size: int) -> AsyncIterator[List[Tuple[int, str]]]:
+    chunk: List[Tuple[int, str]] = []
+    n = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        chunk.append((n, line))
+        n += 1
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _answer_chunk(advisor, chunk: List[Tuple[int, str]], concurrency: int) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    items = []
+    slots = []
+    for n, line in chunk:
+        req, req_id, error = parse_line(line)
+        if req is None:
+            out.append({"line": n, "id": req_id, "error": error})
+            continue
+        slots.append(len(out))
+        out.append({"line": n, "id": req_id})
+        items.append((req.question, req.district, req.crop, req.lang or "en"))
+    if items:
+        results = await advisor.ask_many_async(items, concurrency=concurrency)
+        for slot, res in zip(slots, results):
+            out[slot].update(asdict(res))
+    return out
+
+
+async def answer_lines(advisor, lines: AsyncIterator[str], batch_size: int = BATCH_SIZE,
+                       concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    # Yields one result per non-blank input line, in input order. Lines are taken
+    # batch_size at a time and the next batch is read while the current one is
+    # answered, so at most two batches are held in memory.
+    pending: Optional[asyncio.Future] = None
+    try:
+        async for chunk in _chunks(lines, batch_size):
+            prev, pending = pending, asyncio.ensure_future(_answer_chunk(advisor, chunk, concurrency))
+            if prev is not None:
+                for result in await prev:
+                    yield result
+        if pending is not None:
+            prev, pending = pending, None
+            for result in await prev:
+                yield result
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,401 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import csv
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import INGEST_CHUNK_ROWS, INGEST_WORKERS, RAINFALL_WINDOW_DAYS
+from .data_ingestion import DATASETS, build_corpus, build_index, update_index
+from .index_versions import current_dir
+
+# Share of the requested row count given to each dataset; soil gets one row per district
+SHARES = {
+    "weather": 0.40,
+    "mandi_prices": 0.40,
+    "pest_alerts": 0.10,
+    "crop_calendar": 0.05,
+    "policies": 0.05,
+}
+
+BASE_DISTRICTS = ["Pune", "Indore", "Nashik", "Nagpur", "Bhopal", "Patna", "Ludhiana", "Karnal"]
+BASE_CROPS = ["Wheat", "Rice", "Soybean", "Cotton", "Maize", "Chickpea", "Mustard", "Sugarcane"]
+PESTS = ["Stem borer", "Aphids", "Whitefly", "Pink bollworm", "Fall armyworm", "Leaf folder", "Thrips", "Jassids"]
+CONDITIONS = ["High humidity >70% during tillering", "Warm and dry early season", "Cloudy weather after rain",
+              "Temperature above 35C at flowering", "Late sowing with dense canopy"]
+ADVICE = ["Use light traps; follow IPM", "Use yellow sticky traps; spray neem-based products if needed",
+          "Remove affected plants; apply recommended insecticide as per ICAR", "Encourage natural enemies; avoid excess nitrogen"]
+TEXTURES = [("Loam", 150, "Moderate"), ("Clay loam", 180, "Moderate to slow"), ("Sandy loam", 110, "Good"),
+            ("Black cotton", 200, "Slow"), ("Alluvial", 160, "Moderate")]
+SEASONS = ["Kharif", "Rabi", "Zaid"]
+
+QUESTION_TEMPLATES = [
+    ("When should I irrigate {crop}?", True),
+    ("Should I irrigate this week?", True),
+    ("What is the mandi price of {crop} in {district}?", False),
+    ("How do I control {pest} in {crop}?", False),
+    ("When is the sowing window for {crop}?", False),
+    ("Which government schemes support small farmers?", False),
+    ("What soil does {district} have?", False),
+]
+
+START = date(2020, 1, 1)
+
+
+def district_names(rows: int) -> List[str]:
+    n = min(1000, max(len(BASE_DISTRICTS), int(math.sqrt(rows) / 3)))
+    return (BASE_DISTRICTS + [f"District{i:04d}" for i in range(len(BASE_DISTRICTS), n)])[:n]
+
+
+def _write(path: Path, header: List[str], rows) -> int:
+    n = 0
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        for row in rows:
+            w.writerow(row)
+            n += 1
+    return n
+
+
+def generate_datasets(out_dir: Path, rows: int, seed: int = 0) -> Dict[str, int]:
+    # Deterministic synthetic CSVs for every DATASETS entry, about `rows` rows in total.
+    # Rows are written as they are generated, so 10M-row corpora never sit in memory.
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    districts = district_names(rows)
+    crops = BASE_CROPS + [f"{c} {v}" for v in ("Hybrid", "Desi", "Early", "Late") for c in BASE_CROPS]
+    counts: Dict[str, int] = {}
+
+    def weather():
+        days = max(1, int(rows * SHARES["weather"]) // len(districts))
+        for d in districts:
+            for i in range(days):
+                yield [d, (START + timedelta(days=i)).isoformat(), rng.randint(24, 42), rng.randint(8, 26),
+                       rng.choice((0, 0, 0, 0, 1, 2, 5, 12, 30)), rng.randint(30, 95)]
+
+    def mandi():
+        n = int(rows * SHARES["mandi_prices"])
+        pairs = len(districts) * len(BASE_CROPS)
+        for i in range(n):
+            day, j = divmod(i, pairs)
+            d, c = divmod(j, len(BASE_CROPS))
+            yield [i + 1, BASE_CROPS[c], districts[d], (START + timedelta(days=day)).isoformat(),
+                   rng.randint(1500, 7000), "INR/quintal"]
+
+    def pests():
+        for i in range(int(rows * SHARES["pest_alerts"])):
+            yield [i + 1, rng.choice(crops), rng.choice(PESTS), rng.choice(CONDITIONS), rng.choice(ADVICE), "ICAR"]
+
+    def calendar():
+        for i in range(int(rows * SHARES["crop_calendar"])):
+            crop = crops[i] if i < len(crops) else f"{rng.choice(crops)} {i}"
+            sow = START + timedelta(days=rng.randint(0, 364))
+            yield [crop, rng.choice(SEASONS), sow.isoformat(), (sow + timedelta(days=45)).isoformat(), rng.randint(90, 160)]
+
+    def policies():
+        for i in range(int(rows * SHARES["policies"])):
+            yield [f"SCH{i:06d}", f"Scheme {i} for {rng.choice(crops)} growers", "Small and marginal farmers",
+                   f"Rs. {rng.randint(1, 60) * 1000}/year", f"https://example.invalid/schemes/{i}"]
+
+    def soil():
+        for d in districts:
+            texture, whc, drainage = rng.choice(TEXTURES)
+            yield [d, texture, whc, drainage]
+
+    generators = {
+        "weather": (["district", "date", "tmax_c", "tmin_c", "rain_mm", "humidity_pct"], weather),
+        "crop_calendar": (["crop", "season", "sowing_start", "sowing_end", "duration_days"], calendar),
+        "pest_alerts": (["id", "crop", "pest", "conditions", "advice", "source"], pests),
+        "mandi_prices": (["id", "commodity", "district", "date", "modal_price", "unit"], mandi),
+        "soil": (["district", "soil_texture", "whc_mm", "drainage"], soil),
+        "policies": (["scheme", "name", "eligibility", "benefit", "link"], policies),
+    }
+    for name, meta in DATASETS.items():
+        header, gen = generators[name]
+        counts[name] = _write(out_dir / meta["file"], header, gen())
+    return counts
+
+
+def make_questions(n: int, districts: List[str], seed: int = 0) -> List[Tuple[str, str, str, bool]]:
+    # (question, district, crop, is_irrigation)
+    rng = random.Random(seed + 1)
+    out = []
+    for _ in range(n):
+        template, irrigation = rng.choice(QUESTION_TEMPLATES)
+        district, crop = rng.choice(districts), rng.choice(BASE_CROPS)
+        out.append((template.format(crop=crop, district=district, pest=rng.choice(PESTS)), district, crop, irrigation))
+    return out
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    # samples in seconds; nearest-rank percentiles in milliseconds
+    if not samples:
+        return {"n": 0}
+    ms = sorted(s * 1000 for s in samples)
+
+    def pct(q: float) -> float:
+        return round(ms[min(len(ms) - 1, max(0, math.ceil(q * len(ms)) - 1))], 3)
+
+    total = sum(samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ms[-1], 3),
+        "per_s": round(len(ms) / total, 1) if total > 0 else None,
+    }
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_ingest(data_dir: Path, work_dir: Path, inmemory_max: int, workers: int, chunk_rows: int,
+                 rows: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    if rows <= inmemory_max:
+        # The original whole-corpus path, kept so the streaming path has a baseline
+        corpus, t_corpus = timed(lambda: build_corpus(data_dir))
+        _, t_index = timed(lambda: build_index(corpus, work_dir / "index_inmemory"))
+        out["build_corpus_s"] = round(t_corpus, 3)
+        out["build_index_s"] = round(t_index, 3)
+        del corpus
+    stats, t_stream = timed(lambda: update_index(data_dir, work_dir / "index", workers=workers, chunk_rows=chunk_rows))
+    out["update_index_s"] = round(t_stream, 3)
+    out["docs"] = stats["docs"]
+    out["index_bytes"] = sum(p.stat().st_size for p in current_dir(work_dir / "index").iterdir() if p.is_file())
+    return out
+
+
+def _queries(questions: List[Tuple[str, str, str, bool]]) -> List[str]:
+    return [f"{q} | district: {d} | crop: {c}" for q, d, c, _ in questions]
+
+
+def _doc_keys(hits: List[Dict[str, Any]]) -> List[str]:
+    return [json.dumps({k: v for k, v in h.items() if k != "score"}, sort_keys=True) for h in hits]
+
+
+def exact_top_k(index_dir: Path, questions: List[Tuple[str, str, str, bool]], scoring: str) -> List[List[str]]:
+    # Exhaustive top-k per query, the reference for recall@k of the other backends
+    from .retriever import LocalRetriever
+    retriever = LocalRetriever(index_dir, backend="python", scoring=scoring)
+    return [_doc_keys(retriever.retrieve(q)) for q in _queries(questions)]
+
+
+def bench_retrieval(index_dir: Path, questions: List[Tuple[str, str, str, bool]], backend: str,
+                    scoring: str = "cosine", reference: Optional[List[List[str]]] = None) -> Dict[str, Any]:
+    from .retriever import LocalRetriever
+    retriever, t_open = timed(lambda: LocalRetriever(index_dir, backend=backend, scoring=scoring))
+    queries = _queries(questions)
+    _, t_first = timed(lambda: retriever.retrieve(queries[0]))
+    hits: List[List[Dict[str, Any]]] = []
+    samples: List[float] = []
+    for q in queries:
+        ranked, t = timed(lambda q=q: retriever.retrieve(q))
+        hits.append(ranked)
+        samples.append(t)
+    out: Dict[str, Any] = {
+        "index_open_ms": round(t_open * 1000, 3),
+        "first_query_ms": round(t_first * 1000, 3),
+        "retrieve": summarize(samples),
+    }
+    if reference is not None:
+        # Share of the exhaustive top k each query also returned
+        shares = [len(set(_doc_keys(h)) & set(ref)) / len(ref) for h, ref in zip(hits, reference) if ref]
+        out["recall_at_k"] = round(sum(shares) / len(shares), 4) if shares else None
+    if backend == "numpy":
+        _, t_many = timed(lambda: retriever.retrieve_many(queries))
+        out["retrieve_many_per_s"] = round(len(queries) / t_many, 1) if t_many > 0 else None
+    return out
+
+
+def bench_rules(data_dir: Path, districts: List[str]) -> Dict[str, Any]:
+    from .advisories import bulk_irrigation
+    from .rules import when_to_irrigate
+    from .store import RulesDataStore
+    store = RulesDataStore(data_dir)
+    _, t_load = timed(store.districts)
+    samples = [timed(lambda d=d: when_to_irrigate(store.window(d, RAINFALL_WINDOW_DAYS), store.soil(d)))[1]
+               for d in districts]
+    _, t_bulk = timed(lambda: bulk_irrigation(store))
+    return {
+        "store_load_ms": round(t_load * 1000, 3),
+        "when_to_irrigate": summarize(samples),
+        "bulk_irrigation_ms": round(t_bulk * 1000, 3),
+        "districts": len(districts),
+    }
+
+
+def bench_pests(data_dir: Path, index_dir: Path) -> Dict[str, Any]:
+    # Every compiled pest rule over every district's weather, as the scheduled feed pass does
+    from .advisories import PestAlerts
+    from .pests import PEST_RULES_FILE, load_pest_rules
+    from .store import RulesDataStore
+    rules, t_load = timed(lambda: load_pest_rules(current_dir(index_dir) / PEST_RULES_FILE))
+    series = RulesDataStore(data_dir).all_series()
+    alerts, t_eval = timed(lambda: PestAlerts(rules, series))
+    feed, t_feed = timed(lambda: alerts.feed())
+    return {
+        "rules": len(rules),
+        "districts": len(series),
+        "rules_load_ms": round(t_load * 1000, 3),
+        "evaluate_ms": round(t_eval * 1000, 3),
+        "feed_ms": round(t_feed * 1000, 3),
+        "alerts": feed["total"],
+    }
+
+
+def stub_upstreams(request: httpx.Request) -> httpx.Response:
+    # Canned Nominatim / Open-Meteo replies so /ask never leaves the process
+    if "latitude" in request.url.params:
+        days = [(START + timedelta(days=i)).isoformat() for i in range(7)]
+        return httpx.Response(200, json={"daily": {"time": days, "precipitation_sum": [0.0, 2.5, 0.0, 0.0, 8.0, 0.0, 0.0],
+                                                   "temperature_2m_max": [33.0, 31.5, 34.0, 35.0, 30.0, 32.0, 33.5]}})
+    return httpx.Response(200, json=[{"lat": "18.52", "lon": "73.86"}])
+
+
+def bench_ask(data_dir: Path, index_dir: Path, questions: List[Tuple[str, str, str, bool]],
+              backend: str, answer_cache: bool) -> Dict[str, Any]:
+    from . import server
+    from .advice_engine import AgriAdvisor
+    from .cache import TTLCache
+    from .external import AsyncExternalClient
+
+    client = AsyncExternalClient(transport=httpx.MockTransport(stub_upstreams))
+    advisor = AgriAdvisor(data_dir, backend=backend, client=client, index_dir=index_dir)
+    if not answer_cache:
+        advisor.answers = TTLCache(maxsize=0)
+    warm_up = advisor.warm_up(langid=False)
+    server.set_advisor(advisor)
+
+    async def run() -> Dict[str, List[float]]:
+        times: Dict[str, List[float]] = {"irrigation": [], "retrieval": []}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for question, district, crop, irrigation in questions:
+                body = {"question": question, "district": district, "crop": crop, "lang": "en"}
+                t0 = time.perf_counter()
+                r = await http.post("/ask", json=body)
+                r.raise_for_status()
+                times["irrigation" if irrigation else "retrieval"].append(time.perf_counter() - t0)
+        await client.aclose()
+        return times
+
+    times = asyncio.run(run())
+    return {
+        "warm_up_ms": {k: round(v, 3) for k, v in warm_up.items()},
+        "ask": summarize(times["irrigation"] + times["retrieval"]),
+        "ask_irrigation": summarize(times["irrigation"]),
+        "ask_retrieval": summarize(times["retrieval"]),
+        "upstream_calls": client.upstream_calls,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_size(rows: int, work_dir: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    data_dir = work_dir / "data"
+    counts, t_gen = timed(lambda: generate_datasets(data_dir, rows, seed=args.seed))
+    districts = district_names(rows)
+    questions = make_questions(args.queries, districts, seed=args.seed)
+    result: Dict[str, Any] = {"rows": rows, "dataset_rows": counts, "generate_s": round(t_gen, 3)}
+    result["ingest"] = bench_ingest(data_dir, work_dir, args.inmemory_max, args.workers, args.chunk_rows, rows)
+    result["retrieval"] = {}
+    for scoring in args.scorings:
+        reference = exact_top_k(work_dir / "index", questions, scoring)
+        result["retrieval"][scoring] = {b: bench_retrieval(work_dir / "index", questions, b, scoring, reference)
+                                        for b in args.backends}
+    result["rules"] = bench_rules(data_dir, districts)
+    result["pests"] = bench_pests(data_dir, work_dir / "index")
+    if args.ask_requests:
+        result["ask"] = bench_ask(data_dir, work_dir / "index", questions[:args.ask_requests], args.backends[0],
+                                  args.answer_cache)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval, rules and /ask on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000],
+                        help="Total synthetic rows per run, e.g. 10000 1000000 10000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000, help="Retrieval queries per backend")
+    parser.add_argument("--ask-requests", type=int, default=200, help="End-to-end /ask requests (0 = skip)")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on during /ask")
+    parser.add_argument("--backends", nargs="+", default=["python"], choices=["python", "numpy", "maxscore"])
+    parser.add_argument("--scorings", nargs="+", default=["cosine"], choices=["cosine", "bm25"],
+                        help="Retrieval scorings to time each backend with; recall@k is against exhaustive python")
+    parser.add_argument("--inmemory-max", type=int, default=1_000_000,
+                        help="Also time build_corpus/build_index up to this many rows")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    parser.add_argument("--work-dir", type=str, help="Keep generated data and indexes here (default: temp dir)")
+    parser.add_argument("--out", type=str, help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "queries": args.queries,
+            "ask_requests": args.ask_requests,
+            "answer_cache": args.answer_cache,
+        },
+        "runs": [],
+    }
+    for rows in args.rows:
+        if args.work_dir:
+            work_dir = Path(args.work_dir) / f"rows_{rows}"
+            shutil.rmtree(work_dir, ignore_errors=True)
+            work_dir.mkdir(parents=True)
+        else:
+            work_dir = Path(tempfile.mkdtemp(prefix=f"agri_bench_{rows}_"))
+        try:
+            report["runs"].append(run_size(rows, work_dir, args))
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,33 @@
 from __future__ import annotations
+import asyncio
+import json
+import time
+from functools import lru_cache
 import typer
 from rich.console import Console
 from pathlib import Path
 
-from .advice_engine import AgriAdvisor
-from .config import SAMPLES_DIR
+from .config import SAMPLES_DIR, BATCH_SIZE, BATCH_CONCURRENCY
+
+_T0 = time.perf_counter()
 
 app = typer.Typer(add_completion=False)
 console = Console()
 
-advisor = AgriAdvisor(SAMPLES_DIR)
+
+@lru_cache(maxsize=1)
+def get_advisor():
+    # Built on first use so --help and argument errors skip the engine imports entirely
+    from .advice_engine import AgriAdvisor
+    return AgriAdvisor(SAMPLES_DIR)
 
 @app.command()
 def ask(q: str = typer.Option(..., "--q", help="Your question"),
         district: str = typer.Option("", "--district"),
         crop: str = typer.Option("", "--crop"),
-        lang: str = typer.Option("en", "--lang")):
-    res = advisor.ask(q, district=district or None, crop=crop or None, lang=lang)
+        lang: str = typer.Option("en", "--lang"),
+        timings: bool = typer.Option(False, "--timings", help="Print per-stage timings")):
+    res = get_advisor().ask(q, district=district or None, crop=crop or None, lang=lang, timings=timings)
     console.rule("Answer")
     console.print(res.answer)
     console.rule("Confidence")
@@ -27,6 +38,65 @@ def ask(q: str = typer.Option(..., "--q", help="Your question"),
     console.rule("Citations")
     for c in res.citations:
         console.print(f"- {c.get('dataset')} ({c.get('source')})")
+    if timings:
+        console.rule("Timings (ms)")
+        for stage, ms in res.debug["timings_ms"].items():
+            console.print(f"- {stage}: {ms:.1f}")
+
+@app.command("ask-batch")
+def ask_batch(in_path: Path = typer.Option(..., "--in", help="JSONL file, one question object per line"),
+              out_path: Path = typer.Option(..., "--out", help="JSONL results, in input order"),
+              batch_size: int = typer.Option(BATCH_SIZE, "--batch-size"),
+              concurrency: int = typer.Option(BATCH_CONCURRENCY, "--concurrency")):
+    from .batch import aiter_sync, answer_lines
+    advisor = get_advisor()
+
+    async def run() -> int:
+        n = 0
+        try:
+            with in_path.open("r", encoding="utf-8") as src, out_path.open("w", encoding="utf-8") as dst:
+                async for result in answer_lines(advisor, aiter_sync(src), batch_size, concurrency):
+                    dst.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    n += 1
+        finally:
+            await advisor.external.aclose()
+        return n
+
+    t0 = time.perf_counter()
+    n = asyncio.run(run())
+    console.print(f"Answered {n} lines in {time.perf_counter() - t0:.1f}s -> {out_path}")
+
+@app.command()
+def advisories():
+    for adv in get_advisor().irrigation_advisories():
+        console.rule(f"{adv['district']} ({adv['confidence']:.2f})")
+        console.print(adv["answer"])
+
+@app.command("pest-alerts")
+def pest_alerts(district: str = typer.Option("", "--district"),
+                crop: str = typer.Option("", "--crop"),
+                limit: int = typer.Option(20, "--limit"),
+                as_json: bool = typer.Option(False, "--json", help="Print the feed as JSON")):
+    feed = get_advisor().pest_alerts(district or None, crop or None, limit)
+    if as_json:
+        console.print_json(json.dumps(feed, ensure_ascii=False))
+        return
+    for alert in feed["alerts"]:
+        stage = f", {alert['stage']}" if alert["stage"] else ""
+        console.rule(f"{alert['district']}: {alert['pest']} on {alert['crop']}{stage} ({alert['score']:.2f})")
+        console.print("; ".join(alert["matched"]) + f" as of {alert['as_of']}")
+        console.print(alert["advice"])
+    console.print(f"{len(feed['alerts'])} of {feed['total']} alerts; {feed['rules']} rules x {feed['districts']} districts "
+                  f"evaluated in {feed['evaluated_ms']:.0f} ms")
+
+@app.command()
+def warmup(langid: bool = typer.Option(True, "--langid/--no-langid", help="Also load the langid model")):
+    t0 = time.perf_counter()
+    advisor = get_advisor()
+    timings = {"advisor_init_ms": (time.perf_counter() - t0) * 1000}
+    timings.update(advisor.warm_up(langid=langid))
+    timings["cold_start_ms"] = (time.perf_counter() - _T0) * 1000
+    console.print(json.dumps({k: round(v, 1) for k, v in timings.items()}))
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
@@ -8,10 +9,73 @@ INDEX_DIR = DATA_DIR / "index"
 SUPPORTED_LANGS = {"en", "hi"}
 DEFAULT_LANG = "en"
 
+# Ingestion config
+INGEST_CHUNK_ROWS = 50_000
+INGEST_WORKERS = os.cpu_count() or 1
+
 # Retrieval config
 MAX_DOCS = 8
+# "python" scores one query at a time over the inverted index; "numpy" scores batches with a CSR matrix;
+# "maxscore" is "python" with dynamic pruning: it skips docs that cannot reach the top k
+RETRIEVAL_BACKEND = "python"
+# "cosine" (augmented TF-IDF) or "bm25"; the maxscore backend prunes with per-term score bounds
+RETRIEVAL_SCORING = "cosine"
+# BM25 parameters, applied when the index is built
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Candidate doc runs kept per distinct retrieval filter set
+FILTER_CACHE_SIZE = 256
+
+# Ingestion publishes each build as a new index version; the server polls for it and hot-swaps
+INDEX_KEEP_VERSIONS = 3
+INDEX_WATCH_ENABLED = os.environ.get("AGRI_INDEX_WATCH", "1") == "1"
+INDEX_WATCH_INTERVAL_S = 5.0
+
+# Where the server does an answer's CPU-bound work: "inline" on the event loop, or "pool" in
+# pre-warmed worker processes. The pool admits one answer per worker plus ASK_QUEUE_LIMIT
+# waiting; requests past that get 503 with Retry-After at once.
+ASK_EXECUTION = os.environ.get("AGRI_ASK_EXECUTION", "inline")
+ASK_WORKERS = int(os.environ.get("AGRI_ASK_WORKERS", os.cpu_count() or 1))
+ASK_QUEUE_LIMIT = int(os.environ.get("AGRI_ASK_QUEUE", "32"))
+ASK_RETRY_AFTER_S = 1
+
+# Answer cache (LRU + TTL), invalidated when the index or weather/soil CSVs change
+ANSWER_CACHE_SIZE = 4096
+ANSWER_CACHE_TTL_S = 300.0
+
+# Batch questions (/ask/batch, cli ask-batch): lines per retrieval batch, concurrent forecast lookups
+BATCH_SIZE = 256
+BATCH_CONCURRENCY = 16
 
 # Simple irrigation heuristics
 RAINFALL_WINDOW_DAYS = 3
 RAINFALL_THRESHOLD_MM = 15.0
-HIGH_TEMP_C = 35.0
\ No newline at end of file
+HIGH_TEMP_C = 35.0
+
+# Price-trend answers: a 30-day move within this % of the mean is "steady"; districts listed at most
+PRICE_STEADY_PCT = 2.0
+PRICE_MAX_SERIES = 3
+
+# Pest alert feed: alerts returned per request by default; the server re-evaluates every rule
+# over all districts' weather on this schedule (only when the rules or weather changed)
+PEST_FEED_LIMIT = 100
+PEST_FEED_ENABLED = os.environ.get("AGRI_PEST_FEED", "1") == "1"
+PEST_FEED_INTERVAL_S = 300.0
+
+# External APIs (URLs can be pointed at a local stub server)
+NOMINATIM_URL = os.environ.get("AGRI_NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+OPEN_METEO_URL = os.environ.get("AGRI_OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+EXTERNAL_TIMEOUT_S = 10.0
+EXTERNAL_MAX_CONNECTIONS = 20
+EXTERNAL_PER_HOST_LIMIT = 4
+GEOCODE_TTL_S = 7 * 24 * 3600.0
+FORECAST_TTL_S = 3600.0
+
+# Load the index, data store and langid before the server takes traffic
+WARMUP_ON_STARTUP = os.environ.get("AGRI_WARMUP", "1") == "1"
+
+# Background forecast prefetch (server only)
+PREFETCH_ENABLED = os.environ.get("AGRI_PREFETCH", "1") == "1"
+PREFETCH_INTERVAL_S = 900.0
+FORECAST_FRESH_S = 1800.0
+PREFETCH_RECENT_S = 6 * 3600.0
@@ -1,43 +1,62 @@
 from __future__ import annotations
 import argparse
 from pathlib import Path
+from array import array
 import csv
+import hashlib
+import io
 import json
 import math
-from collections import Counter, defaultdict
-from typing import List, Dict, Any
+import os
+import shutil
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Deque, IO, Iterable, Iterator, Optional, Sequence, Tuple
 
-from .config import INDEX_DIR
+from .config import BM25_B, BM25_K1, INDEX_DIR, INGEST_CHUNK_ROWS, INGEST_WORKERS
+from .index_format import INDEX_FILE, write_index
+from .index_versions import current_dir, new_version_dir, publish
+from .pests import PEST_RULES_FILE, write_pest_rules
+from .prices import PRICES_FILE, write_price_store
+from .text import Vocabulary, field_value, tokenize
+
+# Bumped when the per-doc records in index/state change shape; older state is rebuilt
+STATE_FORMAT = 3
 
 DATASETS = {
     "weather": {
         "file": "weather_sample.csv",
         "key": "weather_id",
         "text_fields": ["district", "date", "tmax_c", "tmin_c", "rain_mm", "humidity_pct"],
+        "fields": {"district": "district", "date": "date"},
         "source": "IMD sample",
     },
     "crop_calendar": {
         "file": "crop_calendar.csv",
         "key": "crop",
         "text_fields": ["crop", "season", "sowing_start", "sowing_end", "duration_days"],
+        "fields": {"crop": "crop"},
         "source": "ICAR sample",
     },
     "pest_alerts": {
         "file": "pest_alerts.csv",
         "key": "id",
         "text_fields": ["crop", "pest", "conditions", "advice"],
+        "fields": {"crop": "crop"},
         "source": "ICAR/PPVFRA sample",
     },
     "mandi_prices": {
         "file": "mandi_prices.csv",
         "key": "id",
         "text_fields": ["commodity", "district", "date", "modal_price", "unit"],
+        "fields": {"crop": "commodity", "district": "district", "date": "date"},
         "source": "Agmarknet sample",
     },
     "soil": {
         "file": "soil_types.csv",
         "key": "district",
         "text_fields": ["district", "soil_texture", "whc_mm", "drainage"],
+        "fields": {"district": "district"},
         "source": "Soil Health Card sample",
     },
     "policies": {
@@ -51,13 +70,31 @@ DATASETS = {
 
 def read_csv_rows(path: Path) -> List[Dict[str, str]]:
     rows: List[Dict[str, str]] = []
-    with path.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append({k: (v if v is not None else "") for k, v in row.items()})
+    for chunk in iter_csv_chunks(path):
+        rows.extend(chunk)
     return rows
 
 
+def row_doc(name: str, meta: Dict[str, Any], i: int, row: Dict[str, str]) -> Dict[str, Any]:
+    text = " | ".join(str(row.get(field, "")) for field in meta["text_fields"])  # type: ignore
+    return {
+        "__dataset": name,
+        "__source": meta["source"],
+        "__id": str(i),
+        "__text": text,
+    }
+
+
+def row_fields(meta: Dict[str, Any], row: Dict[str, str]) -> Dict[str, str]:
+    # Filterable field -> canonical value, for the fields this dataset has a column for
+    fields: Dict[str, str] = {}
+    for field, column in meta.get("fields", {}).items():
+        value = field_value(field, row.get(column))
+        if value:
+            fields[field] = value
+    return fields
+
+
 def build_corpus(data_dir: Path) -> List[Dict[str, Any]]:
     corpus: List[Dict[str, Any]] = []
     for name, meta in DATASETS.items():
@@ -66,62 +103,333 @@ def build_corpus(data_dir: Path) -> List[Dict[str, Any]]:
             continue
         rows = read_csv_rows(fpath)
         for i, row in enumerate(rows):
-            text = " | ".join(str(row.get(field, "")) for field in meta["text_fields"])  # type: ignore
-            corpus.append({
-                "__dataset": name,
-                "__source": meta["source"],
-                "__id": str(i),
-                "__text": text,
-            })
+            corpus.append(row_doc(name, meta, i, row))
     return corpus
 
 
-def tokenize(text: str) -> List[str]:
-    buf = []
-    word = []
-    for ch in text.lower():
-        if ch.isalnum():
-            word.append(ch)
-        else:
-            if word:
-                buf.append("".join(word))
-                word = []
-    if word:
-        buf.append("".join(word))
-    return [w for w in buf if w]
+def build_index(corpus: List[Dict[str, Any]], index_dir: Path, fields: Optional[List[Dict[str, str]]] = None) -> None:
+    # fields: per-doc row_fields values; without them only the dataset can be filtered on.
+    # Term counts are kept per doc as integer id / count arrays over one shared vocabulary
+    vocab = Vocabulary()
+    df = array("I")
+    tfs: List[Tuple[array, array]] = []
+    tokens = 0
+    for doc in corpus:
+        ids, counts = vocab.count(tokenize(doc["__text"]))
+        if len(vocab) > len(df):
+            df.extend([0] * (len(vocab) - len(df)))
+        for tid in ids:
+            df[tid] += 1
+        tfs.append((ids, counts))
+        tokens += sum(counts)
+    fields = fields if fields is not None else [{}] * len(corpus)
+    entries = ((doc, ids, counts, f) for doc, (ids, counts), f in zip(corpus, tfs, fields))
+    version_dir = new_version_dir(index_dir)
+    try:
+        write_tf_index(entries, vocab.terms, df, len(corpus), version_dir, tokens)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    publish(index_dir, version_dir)
 
 
-def build_index(corpus: List[Dict[str, Any]], index_dir: Path) -> None:
+def write_tf_index(entries: Iterable[Tuple[Dict[str, Any], Sequence[int], Sequence[int], Dict[str, str]]],
+                   terms: Sequence[str], df: Sequence[int], num_docs: int, index_dir: Path, tokens: int) -> None:
+    # entries yields (doc, term ids, counts, field values); ids index terms and df.
+    # tokens is the corpus length (sum of all counts), for BM25's average doc length.
     index_dir.mkdir(parents=True, exist_ok=True)
-    if not corpus:
+    if not num_docs:
         raise RuntimeError("Empty corpus; place CSVs in data/samples")
 
-    # Document frequencies
-    df_counter: Counter[str] = Counter()
-    docs_tokens: List[List[str]] = []
-    for doc in corpus:
-        toks = tokenize(doc["__text"])
-        docs_tokens.append(toks)
-        df_counter.update(set(toks))
-
-    num_docs = len(corpus)
-    idf: Dict[str, float] = {term: math.log((1 + num_docs) / (1 + df)) + 1.0 for term, df in df_counter.items()}
-
-    # Build vectors as term->weight dictionaries
-    vectors: List[Dict[str, float]] = []
-    for toks in docs_tokens:
-        tf = Counter(toks)
-        vec: Dict[str, float] = {}
-        max_tf = max(tf.values()) if tf else 1
-        for term, cnt in tf.items():
-            tf_weight = 0.5 + 0.5 * (cnt / max_tf)
-            vec[term] = tf_weight * idf.get(term, 0.0)
-        vectors.append(vec)
-
-    # Save index
-    (index_dir / "corpus.json").write_text(json.dumps(corpus), encoding="utf-8")
-    (index_dir / "idf.json").write_text(json.dumps(idf), encoding="utf-8")
-    (index_dir / "vectors.json").write_text(json.dumps(vectors), encoding="utf-8")
+    idf = array("d", (math.log((1 + num_docs) / (1 + n)) + 1.0 for n in df))
+    bm25_idf = array("d", (math.log(1 + (num_docs - n + 0.5) / (n + 0.5)) for n in df))
+    avgdl = tokens / num_docs or 1.0
+
+    # Vectors are weighted one doc at a time (float32, as stored) and streamed to the writer:
+    # augmented TF-IDF for cosine scoring and BM25 term weights
+    def vectors() -> Iterator[Tuple[Dict[str, Any], Sequence[int], array, Dict[str, str], array]]:
+        for doc, ids, counts, fields in entries:
+            max_tf = max(counts) if counts else 1
+            weights = array("f", [(0.5 + 0.5 * (cnt / max_tf)) * idf[tid] for tid, cnt in zip(ids, counts)])
+            norm_k = BM25_K1 * (1 - BM25_B + BM25_B * sum(counts) / avgdl)
+            bm25 = array("f", [bm25_idf[tid] * cnt * (BM25_K1 + 1) / (cnt + norm_k) for tid, cnt in zip(ids, counts)])
+            yield doc, ids, weights, fields, bm25
+
+    # Inverted index, document norms and per-term score bounds are computed once here instead of per query
+    write_index(index_dir / INDEX_FILE, vectors(), terms, df, idf, num_docs, bm25=(BM25_K1, BM25_B, avgdl))
+
+
+def iter_csv_chunks(path: Path, chunk_rows: int = INGEST_CHUNK_ROWS, offset: int = 0) -> Iterator[List[Dict[str, str]]]:
+    # Rows in bounded chunks, optionally resuming after a byte watermark;
+    # the header always comes from the top of the file
+    with path.open("rb") as f:
+        header = next(csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline="")), [])
+    with path.open("rb") as f:
+        f.seek(offset)
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        reader = csv.DictReader(text, fieldnames=header) if offset else csv.DictReader(text)
+        chunk: List[Dict[str, str]] = []
+        for row in reader:
+            chunk.append({k: (v if v is not None else "") for k, v in row.items()})
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _tokenize_chunk(name: str, start: int, rows: List[Dict[str, str]], part_path: str) -> Tuple[int, Counter, int]:
+    # Runs in a worker process: writes one state part file and returns the chunk's
+    # document frequencies and token count
+    meta = DATASETS[name]
+    df: Counter[str] = Counter()
+    tokens = 0
+    with open(part_path, "w", encoding="utf-8") as f:
+        for i, row in enumerate(rows, start):
+            doc = row_doc(name, meta, i, row)
+            toks = tokenize(doc["__text"])
+            tf = Counter(toks)
+            df.update(tf.keys())
+            tokens += len(toks)
+            f.write(json.dumps({"doc": doc, "tf": tf, "fields": row_fields(meta, row)}, ensure_ascii=False) + "\n")
+    return len(rows), df, tokens
+
+
+def _tokenize_dataset(name: str, path: Path, start: int, offset: int, out: IO[bytes], parts_dir: Path,
+                      df: Counter, pool: Optional[ProcessPoolExecutor], workers: int,
+                      chunk_rows: int) -> Tuple[int, int]:
+    # Chunks are tokenized in the pool, then merged in input order: part files are
+    # appended to the dataset's state file and chunk document frequencies are summed.
+    # At most two chunks per worker are in flight, which bounds memory.
+    pending: Deque[Tuple[Any, Path]] = deque()
+    max_pending = 2 * workers
+    added = tokens = 0
+
+    def merge(result: Tuple[int, Counter, int], part: Path) -> None:
+        nonlocal added, tokens
+        count, chunk_df, chunk_tokens = result
+        df.update(chunk_df)
+        added += count
+        tokens += chunk_tokens
+        with part.open("rb") as src:
+            shutil.copyfileobj(src, out)
+        part.unlink()
+
+    for ci, rows in enumerate(iter_csv_chunks(path, chunk_rows, offset)):
+        part = parts_dir / f"{name}.{ci}.jsonl"
+        args = (name, start, rows, str(part))
+        start += len(rows)
+        if pool is None:
+            merge(_tokenize_chunk(*args), part)
+            continue
+        pending.append((pool.submit(_tokenize_chunk, *args), part))
+        if len(pending) >= max_pending:
+            fut, done_part = pending.popleft()
+            merge(fut.result(), done_part)
+    while pending:
+        fut, done_part = pending.popleft()
+        merge(fut.result(), done_part)
+    return added, tokens
+
+
+def _file_digest(path: Path, size: int) -> str:
+    h = hashlib.sha256()
+    remaining = size
+    with path.open("rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def _iter_state_docs(path: Path) -> Iterator[Dict[str, Any]]:
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _carry_over(previous: Path, target: Path) -> bool:
+    # Reuse a derived file of the published version: hard-linked, or copied where links fail
+    if not previous.exists():
+        return False
+    try:
+        os.link(previous, target)
+    except OSError:
+        shutil.copy2(previous, target)
+    return True
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def update_index(data_dir: Path, index_dir: Path, workers: int = INGEST_WORKERS,
+                 chunk_rows: int = INGEST_CHUNK_ROWS) -> Dict[str, Any]:
+    # state/manifest.json keeps each dataset's consumed byte length and its SHA-256.
+    # A file that only grew past that watermark gets just its new rows tokenized;
+    # any other change retires and re-tokenizes that dataset alone. Per-doc term
+    # counts live in state/<dataset>*.jsonl and document frequencies in state/df*.json,
+    # so IDF and every vector are recomputed without re-tokenizing unchanged data.
+    # CSVs are read in chunks, tokenized across a process pool and the index is
+    # written as a stream, so memory stays bounded by the chunk size and vocabulary.
+    # The result is published as a new index version (see index_versions).
+    #
+    # manifest.json is the commit point of the state and is replaced only after the
+    # index is published. It names the state files in use and the length each one was
+    # committed at: re-tokenized datasets and document frequencies go to new files
+    # tagged with the version, appends are cut back to the committed length when the
+    # next run starts, and files the manifest does not name are left over from a run
+    # that failed, so they are removed.
+    state_dir = index_dir / "state"
+    parts_dir = state_dir / "parts"
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = state_dir / "manifest.json"
+    manifest: Dict[str, Any] = {"format": STATE_FORMAT, "datasets": {}}
+    df: Counter[str] = Counter()
+    if manifest_path.exists():
+        saved = json.loads(manifest_path.read_text(encoding="utf-8"))
+        df_path = state_dir / saved.get("df", "df.json")
+        if saved.get("format") == STATE_FORMAT and df_path.exists():
+            manifest = saved
+            df.update(json.loads(df_path.read_text(encoding="utf-8")))
+
+    def state_path(name: str) -> Path:
+        return state_dir / manifest["datasets"][name].get("state", f"{name}.jsonl")
+
+    committed = {manifest.get("df", "df.json")} if manifest["datasets"] else set()
+    for name, entry in manifest["datasets"].items():
+        path = state_path(name)
+        committed.add(path.name)
+        if "state_bytes" in entry and path.exists() and path.stat().st_size > entry["state_bytes"]:
+            os.truncate(path, entry["state_bytes"])
+    for stale in [*state_dir.glob("*.jsonl"), *state_dir.glob("df*.json")]:
+        if stale.name not in committed:
+            stale.unlink()
+
+    version_dir = new_version_dir(index_dir)
+    created: List[Path] = []
+    retired: List[Path] = []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    stats: Dict[str, Any] = {}
+    try:
+        try:
+            for name, meta in DATASETS.items():
+                fpath = data_dir / meta["file"]
+                prev = manifest["datasets"].get(name)
+                st = fpath.stat() if fpath.exists() else None
+                size = st.st_size if st else 0
+
+                if prev is not None and st is not None and size == prev["bytes"] and (
+                    st.st_mtime_ns == prev.get("mtime_ns") or _file_digest(fpath, size) == prev["sha256"]
+                ):
+                    prev["mtime_ns"] = st.st_mtime_ns
+                    stats[name] = {"status": "unchanged", "rows": prev["rows"]}
+                    continue
+
+                appended = (
+                    prev is not None and st is not None and size > prev["bytes"]
+                    and _file_digest(fpath, prev["bytes"]) == prev["sha256"]
+                )
+                if appended:
+                    doc_path = state_path(name)
+                    start, offset, mode, tokens = prev["rows"], prev["bytes"], "ab", prev["tokens"]
+                else:
+                    # Retire everything this dataset contributed before re-reading it
+                    if prev is not None:
+                        for entry in _iter_state_docs(state_path(name)):
+                            df.subtract(entry["tf"].keys())
+                        retired.append(state_path(name))
+                    doc_path = state_dir / f"{name}.{version_dir.name}.jsonl"
+                    start, offset, mode, tokens = 0, 0, "wb", 0
+
+                added = 0
+                if st is not None:
+                    if mode == "wb":
+                        created.append(doc_path)
+                    with doc_path.open(mode) as out:
+                        added, new_tokens = _tokenize_dataset(name, fpath, start, offset, out, parts_dir, df, pool,
+                                                              workers, chunk_rows)
+                    manifest["datasets"][name] = {
+                        "file": meta["file"],
+                        "bytes": size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "sha256": _file_digest(fpath, size),
+                        "rows": start + added,
+                        "tokens": tokens + new_tokens,
+                        "state": doc_path.name,
+                        "state_bytes": doc_path.stat().st_size,
+                    }
+                    stats[name] = {"status": "appended" if appended else "rebuilt", "rows": start + added,
+                                   "new_rows": added}
+                else:
+                    manifest["datasets"].pop(name, None)
+                    stats[name] = {"status": "removed", "rows": 0}
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        df = Counter({term: n for term, n in df.items() if n > 0})
+        num_docs = sum(entry["rows"] for entry in manifest["datasets"].values())
+        tokens = sum(entry["tokens"] for entry in manifest["datasets"].values())
+        vocab = Vocabulary(df)
+
+        def entries() -> Iterator[Tuple[Dict[str, Any], array, array, Dict[str, str]]]:
+            for name in DATASETS:
+                if name in manifest["datasets"]:
+                    for entry in _iter_state_docs(state_path(name)):
+                        tf = entry["tf"]
+                        yield entry["doc"], array("I", map(vocab.get, tf)), array("I", tf.values()), entry["fields"]
+
+        write_tf_index(entries(), vocab.terms, array("I", (df[t] for t in vocab.terms)), num_docs, version_dir, tokens)
+        # The price store and the compiled pest rules are rebuilt from their whole CSVs when
+        # those changed, else carried over from the published version (files are never
+        # rewritten in place)
+        published = current_dir(index_dir)
+
+        def unchanged(*names: str) -> bool:
+            return all(stats.get(name, {}).get("status") == "unchanged" for name in names)
+
+        def rows_of(name: str) -> Iterator[Dict[str, str]]:
+            path = data_dir / DATASETS[name]["file"]
+            return (row for chunk in iter_csv_chunks(path, chunk_rows) for row in chunk) if path.exists() else iter(())
+
+        if not (unchanged("mandi_prices") and _carry_over(published / PRICES_FILE, version_dir / PRICES_FILE)):
+            if (data_dir / DATASETS["mandi_prices"]["file"]).exists():
+                stats["prices"] = write_price_store(version_dir / PRICES_FILE, rows_of("mandi_prices"))
+        if not (unchanged("pest_alerts", "crop_calendar")
+                and _carry_over(published / PEST_RULES_FILE, version_dir / PEST_RULES_FILE)):
+            if (data_dir / DATASETS["pest_alerts"]["file"]).exists():
+                stats["pest_rules"] = write_pest_rules(version_dir / PEST_RULES_FILE, rows_of("pest_alerts"),
+                                                       rows_of("crop_calendar"))
+        publish(index_dir, version_dir)
+    except BaseException:
+        # The committed state is untouched apart from appends, which the next run cuts back
+        shutil.rmtree(version_dir, ignore_errors=True)
+        for path in created:
+            path.unlink(missing_ok=True)
+        raise
+
+    # A failure from here on leaves the old state with the new index published; the next
+    # run then just redoes this one's work
+    df_file = f"df.{version_dir.name}.json"
+    _write_atomic(state_dir / df_file, json.dumps(df))
+    retired.append(state_dir / manifest.get("df", "df.json"))
+    manifest["df"] = df_file
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2))
+    for path in retired:
+        path.unlink(missing_ok=True)
+    return {"docs": num_docs, "version": version_dir.name, "datasets": stats}
 
 
 def main():
@@ -129,14 +437,23 @@ def main():
     parser.add_argument("--data-dir", type=str, required=True)
     parser.add_argument("--db-path", type=str, required=False)
     parser.add_argument("--rebuild-index", action="store_true")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update the index from changed datasets only (see update_index)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Tokenizer processes (1 = inline)")
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
     args = parser.parse_args()
 
     data_dir = Path(args.data_dir)
     index_dir = INDEX_DIR
 
-    corpus = build_corpus(data_dir)
     if args.rebuild_index:
-        build_index(corpus, index_dir)
+        # Streamed full rebuild: drop the incremental state so every dataset is re-read
+        shutil.rmtree(index_dir / "state", ignore_errors=True)
+    if args.rebuild_index or args.incremental:
+        print(json.dumps(update_index(data_dir, index_dir, workers=args.workers, chunk_rows=args.chunk_rows)))
+        return
+
+    corpus = build_corpus(data_dir)
     print(json.dumps({"docs": len(corpus)}))
 
 if __name__ == "__main__":
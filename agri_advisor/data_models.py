@@ -8,6 +8,7 @@ class AskRequest(BaseModel):
     crop: Optional[str] = Field(None, description="Crop name (optional)")
     lang: Optional[str] = Field("en", description="Language code: en|hi")
     date: Optional[str] = Field(None, description="ISO date (YYYY-MM-DD)")
+    timings: bool = Field(False, description="Include per-stage timings (ms) in debug.timings_ms")
 
 class Citation(BaseModel):
     source: str
@@ -1,53 +1,180 @@
 from __future__ import annotations
-from typing import Optional, List, Dict, Any, Tuple
+import asyncio
+from typing import Optional, List, Dict, Any, Tuple, Awaitable, Callable, Hashable
+from urllib.parse import urlsplit
 import httpx
 
+from .cache import TTLCache
+from .metrics import CACHE_REQUESTS, EXTERNAL_ERRORS
+from .config import (
+    NOMINATIM_URL, OPEN_METEO_URL, EXTERNAL_TIMEOUT_S, EXTERNAL_MAX_CONNECTIONS,
+    EXTERNAL_PER_HOST_LIMIT, GEOCODE_TTL_S, FORECAST_TTL_S,
+)
+
 DEFAULT_UA = "AgriAdvisor/0.1 (+https://example.invalid)"
 
 
-def geocode_district(district: str, country: str = "India", timeout: float = 10.0) -> Optional[Tuple[float, float]]:
-    query = f"{district}, {country}"
-    url = "https://nominatim.openstreetmap.org/search"
-    headers = {"User-Agent": DEFAULT_UA}
-    params = {"format": "json", "q": query, "limit": 1}
-    try:
-        with httpx.Client(timeout=timeout, headers=headers) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            if not data:
-                return None
-            lat = float(data[0]["lat"])  # type: ignore
-            lon = float(data[0]["lon"])  # type: ignore
-            return lat, lon
-    except Exception:
+def _geocode_params(district: str, country: str) -> Dict[str, Any]:
+    return {"format": "json", "q": f"{district}, {country}", "limit": 1}
+
+
+def _parse_geocode(data: Any) -> Optional[Tuple[float, float]]:
+    if not data:
         return None
+    lat = float(data[0]["lat"])  # type: ignore
+    lon = float(data[0]["lon"])  # type: ignore
+    return lat, lon
 
 
-def fetch_open_meteo(lat: float, lon: float, timeout: float = 10.0) -> Optional[List[Dict[str, Any]]]:
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+def _open_meteo_params(lat: float, lon: float) -> Dict[str, Any]:
+    return {
         "latitude": lat,
         "longitude": lon,
         "daily": "precipitation_sum,temperature_2m_max",
         "timezone": "auto",
     }
+
+
+def _parse_open_meteo(js: Dict[str, Any]) -> List[Dict[str, Any]]:
+    daily = js.get("daily", {})
+    dates = daily.get("time", [])
+    precip = daily.get("precipitation_sum", [])
+    tmax = daily.get("temperature_2m_max", [])
+    out: List[Dict[str, Any]] = []
+    for i in range(min(len(dates), len(precip), len(tmax))):
+        out.append({
+            "date": dates[i],
+            "rain_mm": float(precip[i]) if precip[i] is not None else 0.0,
+            "tmax_c": float(tmax[i]) if tmax[i] is not None else None,
+        })
+    return out
+
+
+def geocode_district(district: str, country: str = "India", timeout: float = EXTERNAL_TIMEOUT_S) -> Optional[Tuple[float, float]]:
+    headers = {"User-Agent": DEFAULT_UA}
+    try:
+        with httpx.Client(timeout=timeout, headers=headers) as client:
+            r = client.get(NOMINATIM_URL, params=_geocode_params(district, country))
+            r.raise_for_status()
+            return _parse_geocode(r.json())
+    except Exception:
+        EXTERNAL_ERRORS.inc(api="nominatim")
+        return None
+
+
+def fetch_open_meteo(lat: float, lon: float, timeout: float = EXTERNAL_TIMEOUT_S) -> Optional[List[Dict[str, Any]]]:
     try:
         with httpx.Client(timeout=timeout) as client:
-            r = client.get(url, params=params)
+            r = client.get(OPEN_METEO_URL, params=_open_meteo_params(lat, lon))
             r.raise_for_status()
-            js = r.json()
-            daily = js.get("daily", {})
-            dates = daily.get("time", [])
-            precip = daily.get("precipitation_sum", [])
-            tmax = daily.get("temperature_2m_max", [])
-            out: List[Dict[str, Any]] = []
-            for i in range(min(len(dates), len(precip), len(tmax))):
-                out.append({
-                    "date": dates[i],
-                    "rain_mm": float(precip[i]) if precip[i] is not None else 0.0,
-                    "tmax_c": float(tmax[i]) if tmax[i] is not None else None,
-                })
-            return out
+            return _parse_open_meteo(r.json())
     except Exception:
-        return None
\ No newline at end of file
+        EXTERNAL_ERRORS.inc(api="open_meteo")
+        return None
+
+
+class AsyncExternalClient:
+    # One pooled httpx.AsyncClient for all upstream calls. Identical in-flight requests
+    # share a single call, results are kept in TTL caches, and each upstream host gets
+    # its own concurrency cap (Nominatim in particular only tolerates a trickle).
+    def __init__(self,
+                 nominatim_url: str = NOMINATIM_URL,
+                 open_meteo_url: str = OPEN_METEO_URL,
+                 timeout: float = EXTERNAL_TIMEOUT_S,
+                 max_connections: int = EXTERNAL_MAX_CONNECTIONS,
+                 per_host_limit: int = EXTERNAL_PER_HOST_LIMIT,
+                 geocode_ttl: float = GEOCODE_TTL_S,
+                 forecast_ttl: float = FORECAST_TTL_S,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.nominatim_url = nominatim_url
+        self.open_meteo_url = open_meteo_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.geocodes = TTLCache(maxsize=4096, ttl=geocode_ttl)
+        self.forecasts = TTLCache(maxsize=4096, ttl=forecast_ttl)
+        self.upstream_calls = 0
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"User-Agent": DEFAULT_UA},
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def _get_json(self, url: str, params: Dict[str, Any]) -> Any:
+        host = urlsplit(url).netloc
+        sem = self._host_limits.get(host)
+        if sem is None:
+            sem = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        async with sem:
+            self.upstream_calls += 1
+            r = await self._http().get(url, params=params)
+            r.raise_for_status()
+            return r.json()
+
+    async def _dedup(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(call())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller giving up must not cancel the call others are waiting on
+        return await asyncio.shield(fut)
+
+    async def geocode_district(self, district: str, country: str = "India") -> Optional[Tuple[float, float]]:
+        key = (district.strip().lower(), country.lower())
+        cached = self.geocodes.get(key, False)
+        CACHE_REQUESTS.inc(cache="geocode", result="miss" if cached is False else "hit")
+        if cached is not False:
+            return cached
+
+        async def call() -> Optional[Tuple[float, float]]:
+            try:
+                loc = _parse_geocode(await self._get_json(self.nominatim_url, _geocode_params(district, country)))
+            except Exception:
+                EXTERNAL_ERRORS.inc(api="nominatim")
+                return None
+            # An answered lookup, found or not, is cached; transport errors are retried next time
+            self.geocodes.set(key, loc)
+            return loc
+
+        return await self._dedup(("geocode",) + key, call)
+
+    async def fetch_open_meteo(self, lat: float, lon: float, refresh: bool = False) -> Optional[List[Dict[str, Any]]]:
+        key = (round(lat, 4), round(lon, 4))
+        cached = None if refresh else self.forecasts.get(key)
+        if not refresh:
+            CACHE_REQUESTS.inc(cache="forecast", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+        async def call() -> Optional[List[Dict[str, Any]]]:
+            try:
+                daily = _parse_open_meteo(await self._get_json(self.open_meteo_url, _open_meteo_params(lat, lon)))
+            except Exception:
+                EXTERNAL_ERRORS.inc(api="open_meteo")
+                return None
+            self.forecasts.set(key, daily)
+            return daily
+
+        return await self._dedup(("forecast",) + key, call)
+
+    async def forecast_for_district(self, district: str, refresh: bool = False) -> Optional[List[Dict[str, Any]]]:
+        # refresh skips the forecast cache (geocodes are still cached)
+        loc = await self.geocode_district(district)
+        if not loc:
+            return None
+        return await self.fetch_open_meteo(*loc, refresh=refresh)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Any, Dict, Hashable, Iterator, List, Sequence, Tuple
+
+from .index_format import FIELDS
+from .text import field_value
+
+RANGE_KEYS = ("date_from", "date_to")
+
+# Candidate sets are ascending, disjoint, non-adjacent [start, end) doc id runs. Datasets
+# are contiguous in the index, so most field values are a handful of runs.
+Runs = List[Tuple[int, int]]
+
+
+def _pairs(flat: Sequence[int]) -> Runs:
+    it = iter(flat)
+    return list(zip(it, it))
+
+
+def _union(runs: Runs) -> Runs:
+    out: Runs = []
+    for start, end in sorted(runs):
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+def _intersect(a: Runs, b: Runs) -> Runs:
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) * 8 < len(b):
+        # Few runs against many: jump into b for each run of a
+        out: Runs = []
+        ends = [end for _, end in b]
+        for start, end in a:
+            j = bisect_right(ends, start)
+            while j < len(b) and b[j][0] < end:
+                out.append((max(start, b[j][0]), min(end, b[j][1])))
+                j += 1
+        return out
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            out.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def _values(spec: Any) -> List[Any]:
+    if spec is None or isinstance(spec, str) or not hasattr(spec, "__iter__"):
+        return [spec]
+    return list(spec)
+
+
+def _field_runs(index, field: str, spec: Any) -> Runs:
+    # Docs whose field matches any of the given values; None selects docs without the field
+    per_value: List[Runs] = []
+    for value in _values(spec):
+        norm = "" if value is None else field_value(field, value)
+        if norm is not None:
+            per_value.append(_pairs(index.field_runs(field, norm)))
+    if len(per_value) == 1:
+        return per_value[0]
+    return _union([run for runs in per_value for run in runs])
+
+
+def candidate_runs(index, filters: Dict[str, Any]) -> Runs:
+    # Docs matching every filter, as runs. Keys are index_format.FIELDS, each given a
+    # value or a collection of values (None in it also admits docs without that field),
+    # plus inclusive date_from / date_to bounds (ISO strings or dates).
+    sets: List[Runs] = []
+    for key, spec in filters.items():
+        if key in FIELDS:
+            sets.append(_field_runs(index, key, spec))
+        elif key not in RANGE_KEYS:
+            raise ValueError(f"Unknown filter: {key}")
+    lo = field_value("date", filters.get("date_from"))
+    hi = field_value("date", filters.get("date_to"))
+    if (filters.get("date_from") is not None and lo is None) or (filters.get("date_to") is not None and hi is None):
+        raise ValueError("date_from / date_to must be ISO dates (YYYY-MM-DD)")
+    if lo or hi:
+        sets.append(_union(_pairs(index.field_range_runs("date", lo, hi))))
+    if not sets:
+        return [(0, index.num_docs)] if index.num_docs else []
+    sets.sort(key=len)
+    result = sets[0]
+    for other in sets[1:]:
+        result = _intersect(result, other)
+    return result
+
+
+def filter_key(filters: Dict[str, Any]) -> Hashable:
+    # Hashable form of a filter dict, for caching its candidate runs
+    return tuple(sorted((key, tuple(sorted((v is None, str(v)) for v in _values(spec))))
+                        for key, spec in filters.items()))
+
+
+def iter_docs(runs: Runs) -> Iterator[int]:
+    for start, end in runs:
+        yield from range(start, end)
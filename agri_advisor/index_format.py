@@ -0,0 +1,454 @@
+from __future__ import annotations
+import argparse
+from array import array
+import json
+import math
+import mmap
+from pathlib import Path
+import shutil
+import struct
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator, Mapping, Sequence
+
+from .text import Vocabulary
+
+INDEX_FILE = "index.bin"
+MAGIC = b"AGIX"
+VERSION = 4  # 1 stored post_weights as f64, 1-2 had no field sections, 1-3 no score bounds or BM25; all still readable
+
+# Structured fields indexed for filtering; "dataset" comes from each doc's __dataset
+FIELDS = ("dataset", "district", "crop", "date")
+
+# Section order inside index.bin; every section starts on an 8-byte boundary
+SECTIONS = [
+    "term_offsets",  # u64 x (terms + 1), into term_blob
+    "term_blob",  # utf-8 terms sorted by their encoded bytes
+    "idf",  # f64 x terms
+    "post_ptr",  # u64 x (terms + 1), into post_docs / post_weights
+    "post_docs",  # u32 x postings, ascending within a term
+    "post_weights",  # f32 x postings
+    "norms",  # f64 x docs
+    "doc_offsets",  # u64 x (docs + 1), into doc_blob
+    "doc_blob",  # one compact JSON record per doc
+    "field_offsets",  # u64 x (keys + 1), into field_blob
+    "field_blob",  # utf-8 "field\0value" keys sorted by bytes; value "" means the doc has none
+    "field_ptr",  # u64 x (keys + 1), into field_runs (counted in runs)
+    "field_runs",  # u32 [start, end) doc id pairs, ascending per key; every doc is in one key per field
+    "term_max",  # f64 x terms, max of post_weight / doc norm: the term's cosine score bound per unit query weight
+    "post_bm25",  # f32 x postings, BM25 weight of the term in the doc (empty without BM25)
+    "bm25_max",  # f64 x terms, max of post_bm25 (empty without BM25)
+    "bm25_params",  # f64 [k1, b, avgdl] the BM25 weights were computed with (empty without BM25)
+]
+_V2_SECTIONS = 9
+# Sections per header, by index version
+_NUM_SECTIONS = {1: 9, 2: 9, 3: 13, 4: 17}
+# Sections whose sizes are known up front, in file order; the doc blob follows them
+_MAPPED = [name for name in SECTIONS[:_V2_SECTIONS] if name != "doc_blob"] + SECTIONS[13:]
+_HEADER = struct.Struct("<4sIQQQ")
+_SECTION = struct.Struct("<QQ")
+_HEADER_SIZE = _HEADER.size + _SECTION.size * len(SECTIONS)
+
+
+def build_postings(vectors: List[Dict[str, float]]) -> Tuple[Dict[str, List[List[Any]]], List[float]]:
+    # term -> [doc ids, weights]; doc ids ascend because docs are visited in order
+    postings: Dict[str, List[List[Any]]] = {}
+    norms: List[float] = []
+    for doc_id, vec in enumerate(vectors):
+        for term, weight in vec.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = [[], []]
+            entry[0].append(doc_id)
+            entry[1].append(weight)
+        norms.append(math.sqrt(sum(v * v for v in vec.values())) or 1.0)
+    return postings, norms
+
+
+def _pad(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def write_index(path: Path,
+                entries: Iterable[Tuple[Dict[str, Any], Sequence[int], Sequence[float], Mapping[str, str],
+                                        Optional[Sequence[float]]]],
+                terms: Sequence[str], df: Sequence[int], idf: Sequence[float], num_docs: int,
+                bm25: Optional[Tuple[float, float, float]] = None) -> None:
+    # entries yields (doc record, term ids, weights, field values, BM25 weights) in doc id
+    # order, where ids index terms/df/idf (every term must occur in at least one doc) and
+    # both weight sequences are float32 arrays, so norms and bounds match the stored
+    # values exactly. BM25 weights are only read when bm25 = (k1, b, avgdl) is given.
+    # Only the vocabulary and the per-field doc id runs are held in memory: postings are
+    # scattered straight into the mapped output (each term's slot range is known from
+    # df) and the doc blob is spooled to a side file.
+    encoded = [t.encode("utf-8") for t in terms]
+    order = sorted(range(len(terms)), key=encoded.__getitem__)
+    # The file keeps terms in byte order; remap[vocab id] is the id in the file
+    remap = array("I", bytes(4 * len(terms)))
+    term_offsets = array("Q", [0])
+    post_ptr = array("Q", [0])
+    for new_id, old_id in enumerate(order):
+        remap[old_id] = new_id
+        term_offsets.append(term_offsets[-1] + len(encoded[old_id]))
+        post_ptr.append(post_ptr[-1] + df[old_id])
+    num_postings = post_ptr[-1]
+    sizes = {
+        "term_offsets": 8 * (len(terms) + 1),
+        "term_blob": term_offsets[-1],
+        "idf": 8 * len(terms),
+        "post_ptr": 8 * (len(terms) + 1),
+        "post_docs": 4 * num_postings,
+        "post_weights": 4 * num_postings,
+        "norms": 8 * num_docs,
+        "doc_offsets": 8 * (num_docs + 1),
+        "term_max": 8 * len(terms),
+        "post_bm25": 4 * num_postings if bm25 else 0,
+        "bm25_max": 8 * len(terms) if bm25 else 0,
+        "bm25_params": 24 if bm25 else 0,
+    }
+    table: Dict[str, Tuple[int, int]] = {}
+    offset = _HEADER_SIZE + _pad(_HEADER_SIZE)
+    for name in _MAPPED:
+        table[name] = (offset, sizes[name])
+        offset += sizes[name] + _pad(sizes[name])
+    blob_start = offset
+
+    # Write next to the target and rename so readers never map a half-written file
+    tmp = path.with_name(path.name + ".tmp")
+    blob_tmp = path.with_name(path.name + ".docs.tmp")
+    with tmp.open("w+b") as f:
+        f.truncate(blob_start)
+        f.write(_HEADER.pack(MAGIC, VERSION, num_docs, len(terms), num_postings))
+        f.seek(table["term_offsets"][0])
+        f.write(term_offsets.tobytes())
+        f.seek(table["term_blob"][0])
+        for old_id in order:
+            f.write(encoded[old_id])
+        f.seek(table["idf"][0])
+        f.write(array("d", (idf[old_id] for old_id in order)).tobytes())
+        f.seek(table["post_ptr"][0])
+        f.write(post_ptr.tobytes())
+        if bm25:
+            f.seek(table["bm25_params"][0])
+            f.write(array("d", bm25).tobytes())
+        f.flush()
+        del encoded, order
+
+        mm = mmap.mmap(f.fileno(), blob_start)
+        view = memoryview(mm)
+
+        def section(name: str, fmt: str) -> memoryview:
+            start, size = table[name]
+            return view[start:start + size].cast(fmt)
+
+        post_docs = section("post_docs", "I")
+        post_weights = section("post_weights", "f")
+        norms = section("norms", "d")
+        doc_offsets = section("doc_offsets", "Q")
+        post_bm25 = section("post_bm25", "f")
+        term_max = array("d", bytes(8 * len(terms)))
+        bm25_max = array("d", bytes(8 * len(terms) if bm25 else 0))
+        fill = array("Q", post_ptr[:-1])
+        groups: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        count = 0
+        blob_len = 0
+        try:
+            with blob_tmp.open("wb") as blob:
+                for doc_id, (doc, ids, weights, fields, bm25_weights) in enumerate(entries):
+                    if doc_id >= num_docs:
+                        raise RuntimeError(f"Index writer got more than the {num_docs} declared docs")
+                    for field, by_value in groups.items():
+                        value = doc.get("__dataset", "") if field == "dataset" else fields.get(field, "")
+                        runs = by_value.get(value)
+                        if runs is None:
+                            runs = by_value[value] = array("I")
+                        # Docs arrive in id order, so a value's docs extend its last run or open one
+                        if runs and runs[-1] == doc_id:
+                            runs[-1] = doc_id + 1
+                        else:
+                            runs.extend((doc_id, doc_id + 1))
+                    norm = norms[doc_id] = math.sqrt(sum(weight * weight for weight in weights)) or 1.0
+                    for vid, weight in zip(ids, weights):
+                        tid = remap[vid]
+                        pos = fill[tid]
+                        fill[tid] = pos + 1
+                        post_docs[pos] = doc_id
+                        post_weights[pos] = weight
+                        if weight / norm > term_max[tid]:
+                            term_max[tid] = weight / norm
+                    if bm25:
+                        for vid, weight in zip(ids, bm25_weights):
+                            tid = remap[vid]
+                            post_bm25[fill[tid] - 1] = weight
+                            if weight > bm25_max[tid]:
+                                bm25_max[tid] = weight
+                    raw = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    blob.write(raw)
+                    blob_len += len(raw)
+                    doc_offsets[doc_id + 1] = blob_len
+                    count = doc_id + 1
+            if count != num_docs or any(fill[i] != post_ptr[i + 1] for i in range(len(terms))):
+                raise RuntimeError("Index writer input did not match the declared doc count and document frequencies")
+            section("term_max", "d")[:] = term_max
+            if bm25:
+                section("bm25_max", "d")[:] = bm25_max
+        finally:
+            for v in (post_docs, post_weights, norms, doc_offsets, post_bm25, view):
+                v.release()
+            mm.close()
+
+        f.seek(blob_start)
+        with blob_tmp.open("rb") as blob:
+            shutil.copyfileobj(blob, f)
+        f.write(b"\0" * _pad(blob_len))
+        table["doc_blob"] = (blob_start, blob_len)
+
+        # Field sections follow the doc blob; their sizes are only known after the pass
+        keys = sorted(((f"{field}\0{value}".encode("utf-8"), runs)
+                       for field, by_value in groups.items() for value, runs in by_value.items()),
+                      key=lambda item: item[0])
+        del groups
+        field_offsets = array("Q", [0])
+        field_ptr = array("Q", [0])
+        for raw, runs in keys:
+            field_offsets.append(field_offsets[-1] + len(raw))
+            field_ptr.append(field_ptr[-1] + len(runs) // 2)
+
+        def append_section(name: str, chunks: Iterable[bytes]) -> None:
+            start = f.tell()
+            for chunk in chunks:
+                f.write(chunk)
+            size = f.tell() - start
+            f.write(b"\0" * _pad(size))
+            table[name] = (start, size)
+
+        append_section("field_offsets", [field_offsets.tobytes()])
+        append_section("field_blob", (raw for raw, _ in keys))
+        append_section("field_ptr", [field_ptr.tobytes()])
+        append_section("field_runs", (runs.tobytes() for _, runs in keys))
+        for i, name in enumerate(SECTIONS):
+            f.seek(_HEADER.size + i * _SECTION.size)
+            f.write(_SECTION.pack(*table[name]))
+    blob_tmp.unlink()
+    tmp.replace(path)
+
+
+class DocTable:
+    def __init__(self, index: "BinaryIndex"):
+        self._index = index
+
+    def __len__(self) -> int:
+        return self._index.num_docs
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return self._index.doc(i)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._index.num_docs):
+            yield self._index.doc(i)
+
+
+class BinaryIndex:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_docs, self.num_terms, self.num_postings = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an index file")
+        if version not in _NUM_SECTIONS:
+            raise ValueError(f"{self.path} has index version {version}, expected {VERSION}")
+        view = memoryview(self._mm)
+        self._sections: Dict[str, memoryview] = {}
+        offsets: Dict[str, int] = {}
+        for i, name in enumerate(SECTIONS[:_NUM_SECTIONS[version]]):
+            offset, size = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            self._sections[name] = view[offset:offset + size]
+            offsets[name] = offset
+        view.release()
+        self.term_offsets = self._sections["term_offsets"].cast("Q")
+        self.idf_values = self._sections["idf"].cast("d")
+        self.post_ptr = self._sections["post_ptr"].cast("Q")
+        self.post_docs = self._sections["post_docs"].cast("I")
+        self.post_weights = self._sections["post_weights"].cast("f" if version >= 2 else "d")
+        self.norms = self._sections["norms"].cast("d")
+        self.doc_offsets = self._sections["doc_offsets"].cast("Q")
+        # Blobs are read through the mmap directly so lookups compare and decode plain bytes
+        self._term_base = offsets["term_blob"]
+        self._doc_base = offsets["doc_blob"]
+        self.docs = DocTable(self)
+        self.has_fields = version >= 3
+        if self.has_fields:
+            self.field_offsets = self._sections["field_offsets"].cast("Q")
+            self.field_ptr = self._sections["field_ptr"].cast("Q")
+            self.field_run_bounds = self._sections["field_runs"].cast("I")
+            self._field_base = offsets["field_blob"]
+            self.num_field_keys = len(self.field_offsets) - 1
+        # Per-term score bounds (for pruned top-k) since version 4; BM25 weights if built with them
+        self.has_bounds = version >= 4
+        self.has_bm25 = self.has_bounds and len(self._sections["bm25_params"]) > 0
+        if self.has_bounds:
+            self.term_max = self._sections["term_max"].cast("d")
+        if self.has_bm25:
+            self.post_bm25 = self._sections["post_bm25"].cast("f")
+            self.bm25_max = self._sections["bm25_max"].cast("d")
+            self.bm25_params = tuple(self._sections["bm25_params"].cast("d"))
+
+    def term(self, tid: int) -> str:
+        base = self._term_base
+        return self._mm[base + self.term_offsets[tid]:base + self.term_offsets[tid + 1]].decode("utf-8")
+
+    def _bisect(self, base: int, offsets: memoryview, n: int, key: bytes, right: bool = False) -> int:
+        # First position whose entry is >= key (> key with right=True) in a sorted blob
+        mm = self._mm
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cur = mm[base + offsets[mid]:base + offsets[mid + 1]]
+            if cur < key or (right and cur == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def term_id(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        offsets = self.term_offsets
+        base = self._term_base
+        pos = self._bisect(base, offsets, self.num_terms, key)
+        if pos < self.num_terms and self._mm[base + offsets[pos]:base + offsets[pos + 1]] == key:
+            return pos
+        return None
+
+    def _runs(self, start: int, end: int) -> Sequence[int]:
+        return self.field_run_bounds[2 * self.field_ptr[start]:2 * self.field_ptr[end]]
+
+    def field_runs(self, field: str, value: str) -> Sequence[int]:
+        # Flat [start, end, start, end, ...] doc id runs whose field equals value
+        # ("" = docs without it); ascending and disjoint
+        key = f"{field}\0{value}".encode("utf-8")
+        offsets, base = self.field_offsets, self._field_base
+        pos = self._bisect(base, offsets, self.num_field_keys, key)
+        if pos < self.num_field_keys and self._mm[base + offsets[pos]:base + offsets[pos + 1]] == key:
+            return self._runs(pos, pos + 1)
+        return ()
+
+    def field_range_runs(self, field: str, lo: Optional[str] = None, hi: Optional[str] = None) -> Sequence[int]:
+        # Runs of docs with lo <= value <= hi (bytewise; ISO dates sort by time), value by
+        # value, so only ascending within each value. Docs without the field never match.
+        prefix = f"{field}\0".encode("utf-8")
+        offsets, base, n = self.field_offsets, self._field_base, self.num_field_keys
+        start = self._bisect(base, offsets, n, prefix + (lo or "").encode("utf-8"), right=not lo)
+        end = self._bisect(base, offsets, n, prefix + hi.encode("utf-8"), right=True) if hi else \
+            self._bisect(base, offsets, n, f"{field}\1".encode("utf-8"))
+        if end <= start:
+            return ()
+        return self._runs(start, end)
+
+    def idf(self, term: str) -> float:
+        tid = self.term_id(term)
+        return self.idf_values[tid] if tid is not None else 0.0
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        base = self._doc_base
+        return json.loads(self._mm[base + self.doc_offsets[i]:base + self.doc_offsets[i + 1]])
+
+    def close(self) -> None:
+        names = ["term_offsets", "idf_values", "post_ptr", "post_docs", "post_weights", "norms", "doc_offsets"]
+        if self.has_fields:
+            names += ["field_offsets", "field_ptr", "field_run_bounds"]
+        if self.has_bounds:
+            names.append("term_max")
+        if self.has_bm25:
+            names += ["post_bm25", "bm25_max"]
+        for name in names:
+            getattr(self, name).release()
+        for section in self._sections.values():
+            section.release()
+        self._mm.close()
+
+
+class JsonIndex:
+    # Legacy corpus.json / idf.json / vectors.json layout, loaded fully into memory
+    def __init__(self, index_dir: Path):
+        index_dir = Path(index_dir)
+        self.docs: List[Dict[str, Any]] = json.loads((index_dir / "corpus.json").read_text(encoding="utf-8"))
+        idf: Dict[str, float] = json.loads((index_dir / "idf.json").read_text(encoding="utf-8"))
+        vectors: List[Dict[str, float]] = json.loads((index_dir / "vectors.json").read_text(encoding="utf-8"))
+        postings, norms = build_postings(vectors)
+        self.terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+        self._term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.num_docs = len(self.docs)
+        self.num_terms = len(self.terms)
+        self.idf_values = array("d", (idf.get(t, 0.0) for t in self.terms))
+        self.post_ptr = array("Q", [0])
+        self.post_docs = array("I")
+        self.post_weights = array("d")
+        for term in self.terms:
+            self.post_docs.extend(postings[term][0])
+            self.post_weights.extend(postings[term][1])
+            self.post_ptr.append(len(self.post_docs))
+        self.num_postings = len(self.post_docs)
+        self.norms = array("d", norms)
+        self._idf = idf
+        # Filtering, score bounds and BM25 need the sections of an index.bin
+        self.has_fields = False
+        self.has_bounds = False
+        self.has_bm25 = False
+
+    def term(self, tid: int) -> str:
+        return self.terms[tid]
+
+    def term_id(self, term: str) -> Optional[int]:
+        return self._term_ids.get(term)
+
+    def idf(self, term: str) -> float:
+        return self._idf.get(term, 0.0)
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        return self.docs[i]
+
+    def close(self) -> None:
+        pass
+
+
+
+def open_index(index_dir: Path):
+    index_dir = Path(index_dir)
+    if (index_dir / INDEX_FILE).exists():
+        return BinaryIndex(index_dir / INDEX_FILE)
+    return JsonIndex(index_dir)
+
+
+def convert_json_index(index_dir: Path) -> Path:
+    index_dir = Path(index_dir)
+    out = index_dir / INDEX_FILE
+    corpus = json.loads((index_dir / "corpus.json").read_text(encoding="utf-8"))
+    idf: Dict[str, float] = json.loads((index_dir / "idf.json").read_text(encoding="utf-8"))
+    vectors: List[Dict[str, float]] = json.loads((index_dir / "vectors.json").read_text(encoding="utf-8"))
+    vocab = Vocabulary()
+    df = array("I")
+    for vec in vectors:
+        for term in vec:
+            tid = vocab.add(term)
+            if tid == len(df):
+                df.append(0)
+            df[tid] += 1
+
+    # JSON vectors keep no raw term counts, so the converted index has no BM25 weights
+    def entries() -> Iterator[Tuple[Dict[str, Any], array, array, Dict[str, str], None]]:
+        for doc, vec in zip(corpus, vectors):
+            yield doc, array("I", (vocab.get(t) for t in vec)), array("f", vec.values()), {}, None
+
+    write_index(out, entries(), vocab.terms, df, [idf.get(t, 0.0) for t in vocab.terms], len(corpus))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a JSON index directory to index.bin")
+    parser.add_argument("--index-dir", type=str, required=True)
+    args = parser.parse_args()
+    out = convert_json_index(Path(args.index_dir))
+    idx = BinaryIndex(out)
+    print(json.dumps({"index": str(out), "docs": idx.num_docs, "terms": idx.num_terms, "postings": idx.num_postings}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+import asyncio
+from datetime import datetime, timezone
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import List, Optional
+
+from .config import INDEX_KEEP_VERSIONS, INDEX_WATCH_INTERVAL_S
+
+log = logging.getLogger(__name__)
+
+# index_dir/CURRENT names the published build under index_dir/versions/. Builds go into a
+# fresh version directory that nothing reads until CURRENT is renamed over to point at
+# it, so a reader only ever opens a complete index. A directory without CURRENT is the
+# flat layout (index.bin or the JSON files directly inside it) and is read as is.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def current_dir(index_dir: Path) -> Path:
+    index_dir = Path(index_dir)
+    try:
+        name = (index_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return index_dir
+    return index_dir / VERSIONS_DIR / name if name else index_dir
+
+
+def versions(index_dir: Path) -> List[str]:
+    # Version names sort by build time
+    root = Path(index_dir) / VERSIONS_DIR
+    return sorted(p.name for p in root.iterdir() if p.is_dir()) if root.is_dir() else []
+
+
+def new_version_dir(index_dir: Path) -> Path:
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    path = Path(index_dir) / VERSIONS_DIR / name
+    path.mkdir(parents=True)
+    return path
+
+
+def publish(index_dir: Path, version_dir: Path, keep: int = INDEX_KEEP_VERSIONS) -> None:
+    # Atomically point CURRENT at version_dir, then drop all but the `keep` newest
+    # versions up to it. Servers still mapping a dropped version keep their open files.
+    index_dir = Path(index_dir)
+    tmp = index_dir / (CURRENT_FILE + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(version_dir.name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, index_dir / CURRENT_FILE)
+    # Newer directories may be builds still in progress, so only older ones are pruned
+    older = [name for name in versions(index_dir) if name < version_dir.name]
+    for name in older[:max(0, len(older) - (keep - 1))]:
+        shutil.rmtree(index_dir / VERSIONS_DIR / name, ignore_errors=True)
+
+
+class IndexWatcher:
+    # Polls for a newly published index and swaps it into the advisor. Loading and
+    # warming the new version runs in a worker thread, so requests keep being served
+    # from the old one until the swap.
+    def __init__(self, advisor, interval: float = INDEX_WATCH_INTERVAL_S):
+        self.advisor = advisor
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self) -> bool:
+        return await asyncio.to_thread(self.advisor.reload_index)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self.check():
+                    log.info("index reloaded from %s", self.advisor.retriever.index_dir)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("index reload failed; still serving the previous index")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
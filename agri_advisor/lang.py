@@ -0,0 +1,33 @@
+from __future__ import annotations
+from typing import Optional
+
+_langid = None
+
+
+def _script_lang(text: str) -> Optional[str]:
+    # Cheap script check: any Devanagari means Hindi, plain ASCII letters mean English
+    has_alpha = False
+    for ch in text:
+        if "ऀ" <= ch <= "ॿ":
+            return "hi"
+        if ch.isalpha():
+            if not ch.isascii():
+                return None
+            has_alpha = True
+    return "en" if has_alpha else None
+
+
+def detect_language(text: str) -> str:
+    lang = _script_lang(text)
+    if lang is not None:
+        return lang
+    # langid loads its model on import, so only pay for it when the script check is inconclusive
+    return load_langid().classify(text)[0]
+
+
+def load_langid():
+    global _langid
+    if _langid is None:
+        import langid
+        _langid = langid
+    return _langid
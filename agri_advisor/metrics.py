@@ -0,0 +1,155 @@
+from __future__ import annotations
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; wide enough to separate sub-millisecond lookups from 10 s upstream stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[n]) for n in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        if not self.labelnames and not self._values:
+            lines.append(f"{self.name} 0")
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (non-cumulative, last slot is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][slot] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(tuple(str(labels[n]) for n in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._values.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, doc, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, doc, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())  # type: ignore[attr-defined]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ASK_SECONDS = REGISTRY.histogram("agri_ask_seconds", "End-to-end answer time by path; a batch is one observation", ("path",))
+STAGE_SECONDS = REGISTRY.histogram("agri_stage_seconds", "Time spent in each answer stage", ("stage",))
+RETRIEVED_DOCS = REGISTRY.histogram("agri_retrieved_docs", "Documents returned per retrieval",
+                                    buckets=(0, 1, 2, 3, 5, 8, 13, 21))
+CACHE_REQUESTS = REGISTRY.counter("agri_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+EXTERNAL_ERRORS = REGISTRY.counter("agri_external_errors_total", "Failed upstream API calls", ("api",))
+WEATHER_FALLBACKS = REGISTRY.counter("agri_weather_fallback_total",
+                                     "Irrigation answers built from local weather CSVs instead of a forecast", ("reason",))
+STALE_FORECASTS = REGISTRY.counter("agri_stale_forecast_total", "Irrigation answers served from a stale forecast")
+ASK_REJECTED = REGISTRY.counter("agri_ask_rejected_total", "Answers refused with 503 because the worker pool was full")
+
+
+class StageTimer:
+    # Wall-clock time per stage of one request. Each stage is also observed into
+    # STAGE_SECONDS as it ends, so aggregates need no extra bookkeeping.
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            self.stages[name] = self.stages.get(name, 0.0) + dt
+            STAGE_SECONDS.observe(dt, stage=name)
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        # Stages timed elsewhere (e.g. in a worker process), observed here as if timed here
+        for name, dt in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + dt
+            STAGE_SECONDS.observe(dt, stage=name)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def as_ms(self) -> Dict[str, float]:
+        out = {name: round(dt * 1000, 3) for name, dt in self.stages.items()}
+        out["total"] = round(self.elapsed() * 1000, 3)
+        return out
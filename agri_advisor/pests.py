@@ -0,0 +1,185 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from datetime import date
+import json
+import operator
+from pathlib import Path
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .text import field_value
+
+PEST_RULES_FILE = "pest_rules.json"
+FORMAT = 1
+
+# Humidity / temperature conditions look at the mean of the last MEAN_DAYS days of a
+# district's weather, rain conditions at the total of the last RAIN_DAYS days
+MEAN_DAYS = 3
+RAIN_DAYS = 7
+
+OPS: Dict[str, Callable[[Any, Any], Any]] = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+_WORD_OPS = {"above": ">", "over": ">", "exceeding": ">", "more than": ">", "below": "<", "under": "<", "less than": "<"}
+_UNITS = {"humidity_pct": "%", "tmax_c": "°C", "tmin_c": "°C", "rain_mm": " mm"}
+_LABELS = {"humidity_pct": "humidity", "tmax_c": "max temperature", "tmin_c": "min temperature", "rain_mm": "rain"}
+
+# Crop stages as fractions of crop_calendar.csv's duration_days, counted from sowing
+STAGES = {
+    "seedling": (0.0, 0.15),
+    "early season": (0.0, 0.25),
+    "vegetative": (0.1, 0.45),
+    "tillering": (0.15, 0.4),
+    "flowering": (0.45, 0.7),
+    "heading": (0.45, 0.7),
+    "grain filling": (0.6, 0.85),
+    "pod formation": (0.55, 0.8),
+    "boll formation": (0.55, 0.8),
+    "maturity": (0.85, 1.0),
+}
+
+
+@dataclass(frozen=True)
+class Predicate:
+    field: str  # a WeatherSeries column
+    agg: str  # "mean" or "sum" over the last `days` days
+    days: int
+    op: str  # key of OPS
+    value: float
+
+    def describe(self, observed: float) -> str:
+        unit = _UNITS[self.field]
+        what = f"{self.days}-day {'mean' if self.agg == 'mean' else 'total'} {_LABELS[self.field]}"
+        return f"{what} {observed:.0f}{unit} {self.op} {self.value:g}{unit}"
+
+
+@dataclass
+class PestRule:
+    crop: str
+    pest: str
+    conditions: str
+    advice: str
+    source: str
+    predicates: List[Predicate] = field(default_factory=list)
+    # Crop stage the conditions name and, from the crop calendar, when it falls: sowing
+    # starts on sow ("MM-DD") and the stage runs from..to days after that (inclusive)
+    stage: Optional[str] = None
+    sow: Optional[str] = None
+    from_day: int = 0
+    to_day: int = 0
+
+
+def _num(field_name: str, agg: str, days: int):
+    def build(m: re.Match) -> Predicate:
+        op = m.group(1)
+        return Predicate(field_name, agg, days, _WORD_OPS.get(op, op), float(m.group(2)))
+    return build
+
+
+def _fixed(field_name: str, agg: str, days: int, op: str, value: float):
+    return lambda m: Predicate(field_name, agg, days, op, value)
+
+
+_CMP = r"(>=|<=|>|<|above|over|exceeding|more than|below|under|less than)\s*"
+_NUM = r"(\d+(?:\.\d+)?)"
+# Tried in order; each match is blanked out of the text, so "High humidity >70%" is read
+# by the numeric pattern and not again as the bare "high humidity" below it. Vague
+# words get fixed thresholds; "cloudy" stands in as humid since there is no cloud column.
+_PATTERNS: List[Tuple[re.Pattern, Callable[[re.Match], Predicate]]] = [
+    (re.compile(rf"humidity\s*{_CMP}{_NUM}\s*%?"), _num("humidity_pct", "mean", MEAN_DAYS)),
+    (re.compile(rf"(?:night|minimum|min)\s+temp(?:erature)?s?\s*{_CMP}{_NUM}\s*°?\s*c\b"), _num("tmin_c", "mean", MEAN_DAYS)),
+    (re.compile(rf"(?:temp(?:erature)?s?|tmax)\s*{_CMP}{_NUM}\s*°?\s*c\b"), _num("tmax_c", "mean", MEAN_DAYS)),
+    (re.compile(rf"rain(?:fall)?\s*{_CMP}{_NUM}\s*mm\b"), _num("rain_mm", "sum", RAIN_DAYS)),
+    (re.compile(r"\bhigh humidity\b|\bhumid\b"), _fixed("humidity_pct", "mean", MEAN_DAYS, ">=", 80.0)),
+    (re.compile(r"\blow humidity\b"), _fixed("humidity_pct", "mean", MEAN_DAYS, "<=", 40.0)),
+    (re.compile(r"\bcloudy\b|\bovercast\b"), _fixed("humidity_pct", "mean", MEAN_DAYS, ">=", 75.0)),
+    (re.compile(r"\bheavy rains?\b"), _fixed("rain_mm", "sum", RAIN_DAYS, ">=", 50.0)),
+    (re.compile(r"\b(?:after|following) rains?\b|\brainy\b|\bwet\b"), _fixed("rain_mm", "sum", RAIN_DAYS, ">=", 10.0)),
+    (re.compile(r"\bdry\b|\bdrought\b"), _fixed("rain_mm", "sum", RAIN_DAYS, "<=", 2.0)),
+    (re.compile(r"\bfrost\b"), _fixed("tmin_c", "mean", MEAN_DAYS, "<=", 4.0)),
+    (re.compile(r"\bhot\b|\bheat\b"), _fixed("tmax_c", "mean", MEAN_DAYS, ">=", 35.0)),
+    (re.compile(r"\bwarm\b"), _fixed("tmax_c", "mean", MEAN_DAYS, ">=", 30.0)),
+    (re.compile(r"\bcool\b|\bcold\b"), _fixed("tmax_c", "mean", MEAN_DAYS, "<=", 25.0)),
+]
+_STAGE = re.compile(r"\b(" + "|".join(sorted(STAGES, key=len, reverse=True)) + r")\b")
+
+
+def compile_conditions(text: str) -> Tuple[List[Predicate], Optional[str]]:
+    # pest_alerts.csv conditions -> (weather predicates, all of which must hold; crop stage
+    # or None). Phrases it does not know are ignored.
+    rest = text.casefold()
+    predicates: List[Predicate] = []
+    for pattern, build in _PATTERNS:
+        for m in pattern.finditer(rest):
+            predicates.append(build(m))
+        rest = pattern.sub(lambda m: " " * len(m.group(0)), rest)
+    stage = _STAGE.search(rest)
+    return list(dict.fromkeys(predicates)), stage.group(1) if stage else None
+
+
+def _calendar(rows: Iterable[Dict[str, str]]) -> Dict[str, Tuple[str, int, int]]:
+    # crop_calendar.csv -> case-folded crop: (sowing start "MM-DD", sowing window days, duration days)
+    out: Dict[str, Tuple[str, int, int]] = {}
+    for row in rows:
+        crop = field_value("crop", row.get("crop"))
+        start = field_value("date", row.get("sowing_start"))
+        end = field_value("date", row.get("sowing_end"))
+        try:
+            duration = int(float(row.get("duration_days") or ""))
+        except ValueError:
+            continue
+        if crop and start and crop not in out:
+            window = (date.fromisoformat(end) - date.fromisoformat(start)).days if end else 0
+            out[crop] = (start[5:], max(0, window), duration)
+    return out
+
+
+def write_pest_rules(path: Path, alerts: Iterable[Dict[str, str]], calendar: Iterable[Dict[str, str]]) -> Dict[str, int]:
+    # Compiles pest_alerts.csv rows into PestRules (see compile_conditions), with stages
+    # placed on the crop calendar: a stage that starts at day a and ends at day b of a
+    # crop's season is active a..b days after the first sowing date, plus the length of
+    # the sowing window for late sowings. Alerts without a weather predicate, or naming
+    # a stage of a crop the calendar lacks, cannot be evaluated and are left out.
+    seasons = _calendar(calendar)
+    rules: List[PestRule] = []
+    seen = set()
+    compiled: Dict[str, Tuple[List[Predicate], Optional[str]]] = {}
+    alerts_n = uncompiled = no_calendar = 0
+    for row in alerts:
+        alerts_n += 1
+        crop, pest = (row.get("crop") or "").strip(), (row.get("pest") or "").strip()
+        conditions, advice = (row.get("conditions") or "").strip(), (row.get("advice") or "").strip()
+        key = (crop.casefold(), pest.casefold(), conditions.casefold(), advice)
+        if key in seen:
+            continue
+        seen.add(key)
+        if conditions not in compiled:
+            compiled[conditions] = compile_conditions(conditions)
+        predicates, stage = compiled[conditions]
+        if not predicates or not crop:
+            uncompiled += 1
+            continue
+        rule = PestRule(crop, pest, conditions, advice, (row.get("source") or "").strip(), predicates, stage)
+        if stage is not None:
+            season = seasons.get(field_value("crop", crop) or "")
+            if season is None:
+                no_calendar += 1
+                continue
+            rule.sow, window, duration = season
+            lo, hi = STAGES[stage]
+            rule.from_day, rule.to_day = round(lo * duration), round(hi * duration) + window
+        rules.append(rule)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"format": FORMAT, "rules": [asdict(r) for r in rules]}, ensure_ascii=False),
+                   encoding="utf-8")
+    tmp.replace(path)
+    return {"alerts": alerts_n, "rules": len(rules), "uncompiled": uncompiled, "no_calendar": no_calendar}
+
+
+def load_pest_rules(path: Path) -> List[PestRule]:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if data.get("format") != FORMAT:
+        raise ValueError(f"{path} has pest rules format {data.get('format')}, expected {FORMAT}")
+    rules = []
+    for entry in data["rules"]:
+        entry["predicates"] = [Predicate(**p) for p in entry["predicates"]]
+        rules.append(PestRule(**entry))
+    return rules
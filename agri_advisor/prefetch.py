@@ -0,0 +1,117 @@
+from __future__ import annotations
+import asyncio
+import csv
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+
+from .cache import TTLCache
+from .config import FORECAST_FRESH_S, PREFETCH_INTERVAL_S, PREFETCH_RECENT_S
+from .external import AsyncExternalClient
+
+log = logging.getLogger(__name__)
+
+
+def districts_from_csv(path: Path) -> List[str]:
+    try:
+        with path.open("r", newline="", encoding="utf-8") as f:
+            return [r["district"] for r in csv.DictReader(f) if r.get("district")]
+    except Exception:
+        return []
+
+
+class ForecastPrefetcher:
+    # Keeps the last good forecast per district warm. A scheduler refreshes the
+    # configured districts plus recently asked ones every interval; a reader that
+    # finds an aged entry gets it back marked stale while a refresh runs behind it.
+    def __init__(self, client: AsyncExternalClient, districts: Iterable[str] = (),
+                 interval: float = PREFETCH_INTERVAL_S, fresh_for: float = FORECAST_FRESH_S,
+                 recent_for: float = PREFETCH_RECENT_S, clock=time.monotonic):
+        self.client = client
+        self.districts = {d.strip().lower(): d for d in districts if d.strip()}
+        self.interval = interval
+        self.fresh_for = fresh_for
+        self._clock = clock
+        self._recent = TTLCache(maxsize=2048, ttl=recent_for, clock=clock)
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _targets(self) -> Dict[str, str]:
+        targets = dict(self.districts)
+        for key, name in self._recent.items():
+            targets.setdefault(key, name)
+        return targets
+
+    def get(self, district: str) -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+        entry = self._entries.get(district.strip().lower())
+        if entry is None:
+            return None, False
+        fetched_at, daily = entry
+        return daily, self._clock() - fetched_at > self.fresh_for
+
+    async def refresh(self, district: str) -> bool:
+        key = district.strip().lower()
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(key, district))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key: str, district: str) -> bool:
+        try:
+            daily = await self.client.forecast_for_district(district, refresh=True)
+        except Exception:
+            daily = None
+        if not daily:
+            # Keep serving the previous forecast, if any
+            return False
+        self._entries[key] = (self._clock(), daily)
+        return True
+
+    async def forecast(self, district: str) -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+        key = district.strip().lower()
+        daily, stale = self.get(district)
+        if daily is None:
+            await self.refresh(district)
+            daily, stale = self.get(district)
+        elif stale and key not in self._refreshing:
+            asyncio.ensure_future(self.refresh(district))
+        if daily is not None:
+            # Only names that geocoded to a forecast are kept warm, so whatever a client
+            # sends as a district cannot drive background upstream traffic
+            self._recent.set(key, district)
+        return daily, stale
+
+    async def run_once(self) -> int:
+        targets = self._targets()
+        results = await asyncio.gather(*(self.refresh(name) for name in targets.values()), return_exceptions=True)
+        return sum(1 for r in results if r is True)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                refreshed = await self.run_once()
+                log.debug("forecast prefetch refreshed %d districts", refreshed)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("forecast prefetch pass failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._refreshing.values()):
+            task.cancel()
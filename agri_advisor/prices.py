@@ -0,0 +1,322 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+import math
+import mmap
+from pathlib import Path
+import struct
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .text import field_value
+
+PRICES_FILE = "prices.bin"
+MAGIC = b"AGPX"
+VERSION = 1
+
+# Trailing calendar windows (days, including the row's own day) aggregated at build time
+WINDOWS = (7, 30)
+_STATS = ("mean", "min", "max", "slope")
+
+# mandi_prices.csv columns
+COMMODITY, DISTRICT, DATE, PRICE, UNIT = "commodity", "district", "date", "modal_price", "unit"
+
+# One series per (commodity, district); its days are a contiguous, date-sorted slice of
+# the day columns. Sections start on 8-byte boundaries.
+SECTIONS = [
+    "key_offsets",  # u64 x (series + 1), into key_blob
+    "key_blob",  # utf-8 "commodity\0district", case-folded, sorted by bytes
+    "name_offsets",  # u64 x (series + 1), into name_blob
+    "name_blob",  # utf-8 "Commodity\0District\0unit" as first seen, for display
+    "series_ptr",  # u64 x (series + 1), into the day columns
+    "day",  # i32 x days, proleptic ordinals, ascending within a series
+    "price",  # f32 x days, mean modal price of that day's rows
+    "rows",  # u32 x days, source rows averaged into price
+] + [f"{stat}_{w}d" for w in WINDOWS for stat in _STATS]  # f32 x days each; slope is price/day
+_HEADER = struct.Struct("<4sIQQ")
+_SECTION = struct.Struct("<QQ")
+_HEADER_SIZE = _HEADER.size + _SECTION.size * len(SECTIONS)
+
+
+def _pad(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def _series_key(commodity: str, district: str) -> bytes:
+    return f"{field_value('crop', commodity) or ''}\0{field_value('district', district) or ''}".encode("utf-8")
+
+
+def _rolling(days: array, prices: array, window: int) -> Tuple[array, array, array, array]:
+    # Mean, min, max and least-squares slope over the days in (day - window, day], per day.
+    # The running sums are over x = day - first day in the window, so they stay small;
+    # min/max come from monotonic deques.
+    n = len(days)
+    mean, low, high, slope = (array("f", bytes(4 * n)) for _ in range(4))
+    lo = 0
+    base = days[0] if n else 0
+    sx = sy = sxx = sxy = 0.0
+    mins: Deque[int] = deque()
+    maxs: Deque[int] = deque()
+    for i in range(n):
+        while days[lo] <= days[i] - window:
+            x, y = days[lo] - base, prices[lo]
+            sx -= x
+            sy -= y
+            sxx -= x * x
+            sxy -= x * y
+            lo += 1
+        k = i - lo
+        if k == 0:
+            base, sx, sy, sxx, sxy = days[i], 0.0, 0.0, 0.0, 0.0
+        elif days[lo] != base:
+            d = days[lo] - base
+            sxx += k * d * d - 2 * d * sx
+            sxy -= d * sy
+            sx -= k * d
+            base = days[lo]
+        x, y = days[i] - base, prices[i]
+        sx += x
+        sy += y
+        sxx += x * x
+        sxy += x * y
+        k += 1
+        while mins and prices[mins[-1]] >= y:
+            mins.pop()
+        mins.append(i)
+        while maxs and prices[maxs[-1]] <= y:
+            maxs.pop()
+        maxs.append(i)
+        while mins[0] < lo:
+            mins.popleft()
+        while maxs[0] < lo:
+            maxs.popleft()
+        mean[i] = sy / k
+        low[i] = prices[mins[0]]
+        high[i] = prices[maxs[0]]
+        denom = k * sxx - sx * sx
+        slope[i] = (k * sxy - sx * sy) / denom if k > 1 and denom > 0 else math.nan
+    return mean, low, high, slope
+
+
+def write_price_store(path: Path, rows: Iterable[Dict[str, str]]) -> Dict[str, int]:
+    # rows are mandi_prices.csv records in any order. Only per-series (day, price) columns
+    # are held while reading; same-day rows of a series (several markets) are averaged.
+    # Unparseable dates or prices are skipped.
+    series: Dict[bytes, Tuple[str, array, array]] = {}
+    # Raw column values repeat across rows, so their parsed forms are memoized
+    by_name: Dict[Tuple[str, str], Optional[Tuple[bytes, str]]] = {}
+    ordinals: Dict[str, Optional[int]] = {}
+    skipped = 0
+    for row in rows:
+        raw_day = row.get(DATE) or ""
+        day = ordinals.get(raw_day, -1)
+        if day == -1:
+            iso = field_value("date", raw_day)
+            day = ordinals[raw_day] = date.fromisoformat(iso).toordinal() if iso else None
+        try:
+            price = float(row.get(PRICE) or "")
+        except ValueError:
+            price = math.nan
+        name_key = (row.get(COMMODITY) or "", row.get(DISTRICT) or "")
+        if name_key not in by_name:
+            commodity, district = name_key[0].strip(), name_key[1].strip()
+            by_name[name_key] = (_series_key(commodity, district),
+                                 f"{commodity}\0{district}\0{(row.get(UNIT) or '').strip()}") if commodity else None
+        named = by_name[name_key]
+        if day is None or named is None or math.isnan(price):
+            skipped += 1
+            continue
+        # A series is created by its first valid row, so none is ever empty
+        entry = series.get(named[0])
+        if entry is None:
+            entry = series[named[0]] = (named[1], array("l"), array("d"))
+        entry[1].append(day)
+        entry[2].append(price)
+    del by_name, ordinals
+
+    keys = sorted(series)
+    columns: Dict[str, array] = {"day": array("i"), "price": array("f"), "rows": array("I")}
+    for w in WINDOWS:
+        for stat in _STATS:
+            columns[f"{stat}_{w}d"] = array("f")
+    key_offsets, name_offsets, series_ptr = array("Q", [0]), array("Q", [0]), array("Q", [0])
+    names: List[bytes] = []
+    for key in keys:
+        name, raw_days, raw_prices = series.pop(key)
+        order = sorted(range(len(raw_days)), key=raw_days.__getitem__)
+        days, prices, counts = array("i"), array("d"), array("I")
+        for j in order:
+            if days and days[-1] == raw_days[j]:
+                counts[-1] += 1
+                prices[-1] += (raw_prices[j] - prices[-1]) / counts[-1]
+            else:
+                days.append(raw_days[j])
+                prices.append(raw_prices[j])
+                counts.append(1)
+        columns["day"].extend(days)
+        columns["price"].extend(array("f", prices))
+        columns["rows"].extend(counts)
+        for w in WINDOWS:
+            for stat, values in zip(_STATS, _rolling(days, prices, w)):
+                columns[f"{stat}_{w}d"].extend(values)
+        encoded = name.encode("utf-8")
+        names.append(encoded)
+        key_offsets.append(key_offsets[-1] + len(key))
+        name_offsets.append(name_offsets[-1] + len(encoded))
+        series_ptr.append(series_ptr[-1] + len(days))
+
+    sections: Dict[str, Iterable[bytes]] = {
+        "key_offsets": [key_offsets.tobytes()],
+        "key_blob": keys,
+        "name_offsets": [name_offsets.tobytes()],
+        "name_blob": names,
+        "series_ptr": [series_ptr.tobytes()],
+    }
+    sections.update((name, [col.tobytes()]) for name, col in columns.items())
+    # Write next to the target and rename so readers never map a half-written file
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(b"\0" * (_HEADER_SIZE + _pad(_HEADER_SIZE)))
+        table: List[Tuple[int, int]] = []
+        for name in SECTIONS:
+            start = f.tell()
+            for chunk in sections[name]:
+                f.write(chunk)
+            size = f.tell() - start
+            f.write(b"\0" * _pad(size))
+            table.append((start, size))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(keys), len(columns["day"])))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+    tmp.replace(path)
+    return {"series": len(keys), "days": len(columns["day"]), "skipped_rows": skipped}
+
+
+@dataclass
+class PriceTrend:
+    commodity: str
+    district: str
+    unit: str
+    date: date
+    price: float
+    # window days -> {"mean", "min", "max", "slope" (price/day), "days" observed,
+    # "span" (days from the first to the last observation)}
+    windows: Dict[int, Dict[str, float]] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        # JSON-safe: a slope that needs more days (NaN) becomes None
+        return {"commodity": self.commodity, "district": self.district, "unit": self.unit,
+                "date": self.date.isoformat(), "price": self.price,
+                "windows": {f"{w}d": {k: (None if math.isnan(v) else v) for k, v in stats.items()}
+                            for w, stats in self.windows.items()}}
+
+
+class PriceStore:
+    # Read side of prices.bin, memory-mapped like index.bin. Finding a series is a
+    # bisect over its keys and reading a day's aggregates is a fixed set of array
+    # reads, so answers cost the same however long the history is.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_series, self.num_days = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a price store")
+        if version != VERSION:
+            raise ValueError(f"{self.path} has price store version {version}, expected {VERSION}")
+        view = memoryview(self._mm)
+        self._sections: Dict[str, memoryview] = {}
+        self._bases: Dict[str, int] = {}
+        for i, name in enumerate(SECTIONS):
+            offset, size = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            self._sections[name] = view[offset:offset + size]
+            self._bases[name] = offset
+        view.release()
+        fmt = {"key_offsets": "Q", "name_offsets": "Q", "series_ptr": "Q", "day": "i", "rows": "I"}
+        self._cols: Dict[str, memoryview] = {
+            name: self._sections[name].cast(fmt.get(name, "f"))
+            for name in SECTIONS if not name.endswith("_blob")
+        }
+
+    def __len__(self) -> int:
+        return self.num_series
+
+    def _key(self, i: int) -> bytes:
+        offsets, base = self._cols["key_offsets"], self._bases["key_blob"]
+        return self._mm[base + offsets[i]:base + offsets[i + 1]]
+
+    def _bisect(self, key: bytes) -> int:
+        lo, hi = 0, self.num_series
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def series(self, commodity: str, district: Optional[str] = None) -> range:
+        # Series ids for a commodity in one district, or in every district when None
+        crop = field_value("crop", commodity)
+        if crop is None:
+            return range(0)
+        if district is not None:
+            key = _series_key(commodity, district)
+            pos = self._bisect(key)
+            return range(pos, pos + 1) if pos < self.num_series and self._key(pos) == key else range(0)
+        return range(self._bisect(f"{crop}\0".encode("utf-8")), self._bisect(f"{crop}\1".encode("utf-8")))
+
+    def has_commodity(self, commodity: str) -> bool:
+        return len(self.series(commodity)) > 0
+
+    def trend(self, sid: int, on: Optional[date] = None) -> Optional[PriceTrend]:
+        # Aggregates as of the latest day on or before `on` (default: the series' last day)
+        cols = self._cols
+        start, end = cols["series_ptr"][sid], cols["series_ptr"][sid + 1]
+        days = cols["day"]
+        i = end - 1 if on is None else bisect_right(days, on.toordinal(), start, end) - 1
+        if i < start:
+            return None
+        offsets, base = cols["name_offsets"], self._bases["name_blob"]
+        commodity, district, unit = self._mm[base + offsets[sid]:base + offsets[sid + 1]].decode("utf-8").split("\0")
+        windows: Dict[int, Dict[str, float]] = {}
+        for w in WINDOWS:
+            stats = {stat: float(cols[f"{stat}_{w}d"][i]) for stat in _STATS}
+            first = bisect_right(days, days[i] - w, start, i + 1)
+            stats["days"] = i + 1 - first
+            stats["span"] = days[i] - days[first]
+            windows[w] = stats
+        return PriceTrend(commodity, district, unit, date.fromordinal(days[i]), float(cols["price"][i]), windows)
+
+    def close(self) -> None:
+        for col in self._cols.values():
+            col.release()
+        for section in self._sections.values():
+            section.release()
+        self._mm.close()
+
+
+def describe(trend: PriceTrend, steady_pct: float) -> List[str]:
+    # Answer sentences for one series; a 30-day move within steady_pct % of the mean is "steady"
+    unit = f" {trend.unit}" if trend.unit else ""
+    where = f" in {trend.district}" if trend.district else ""
+    lines = [f"{trend.commodity}{where}: {trend.price:,.0f}{unit} on {trend.date.isoformat()}."]
+    parts = []
+    for w, s in trend.windows.items():
+        parts.append(f"{w}-day average {s['mean']:,.0f} (range {s['min']:,.0f}-{s['max']:,.0f}; "
+                     f"{int(s['days'])} of {w} days reported)")
+    lines.append("; ".join(parts) + ".")
+    w = max(trend.windows)
+    stats = trend.windows[w]
+    if math.isnan(stats["slope"]):
+        lines.append(f"Not enough prices in the last {w} days to call a trend.")
+    else:
+        # The move across the days actually reported, not extrapolated to the whole window
+        change = stats["slope"] * stats["span"]
+        pct = 100.0 * change / stats["mean"] if stats["mean"] else 0.0
+        direction = "steady" if abs(pct) < steady_pct else ("rising" if pct > 0 else "falling")
+        lines.append(f"Over {w} days prices are {direction} ({stats['slope']:+,.1f} per day, {pct:+.1f}%).")
+    return lines
@@ -1,67 +1,264 @@
 from __future__ import annotations
 from pathlib import Path
-import json
-from typing import List, Dict, Any
+from bisect import bisect_left
+import heapq
+from typing import List, Dict, Any, Optional, Tuple
 import math
+from operator import truediv
 
-from .config import INDEX_DIR, MAX_DOCS
+from .cache import TTLCache
+from .config import INDEX_DIR, MAX_DOCS, RETRIEVAL_BACKEND, RETRIEVAL_SCORING, FILTER_CACHE_SIZE
+from .index_format import INDEX_FILE, open_index
+from .index_versions import current_dir
+from .filters import Runs, candidate_runs, filter_key, iter_docs
+from .text import tokenize
 
+# Relative margin on score-bound comparisons, so float rounding never prunes a doc that ties
+_BOUND_SLACK = 1e-9
 
-def tokenize(text: str) -> List[str]:
-    buf = []
-    word = []
-    for ch in text.lower():
-        if ch.isalnum():
-            word.append(ch)
-        else:
-            if word:
-                buf.append("".join(word))
-                word = []
-    if word:
-        buf.append("".join(word))
-    return [w for w in buf if w]
+
+def index_version(index_dir: Path) -> Tuple[str, int, int]:
+    # Published directory plus mtime/size of its index file, for callers caching derived results
+    index_dir = current_dir(index_dir)
+    path = index_dir / INDEX_FILE
+    if not path.exists():
+        path = index_dir / "corpus.json"
+    try:
+        st = path.stat()
+    except OSError:
+        return (str(index_dir), -1, -1)
+    return (str(index_dir), st.st_mtime_ns, st.st_size)
 
 
 class LocalRetriever:
-    def __init__(self, index_dir: Path = INDEX_DIR):
-        self.index_dir = Path(index_dir)
-        self.corpus = json.loads((self.index_dir / "corpus.json").read_text(encoding="utf-8"))
-        self.idf: Dict[str, float] = json.loads((self.index_dir / "idf.json").read_text(encoding="utf-8"))
-        self.vectors: List[Dict[str, float]] = json.loads((self.index_dir / "vectors.json").read_text(encoding="utf-8"))
+    def __init__(self, index_dir: Path = INDEX_DIR, backend: str = RETRIEVAL_BACKEND,
+                 scoring: str = RETRIEVAL_SCORING):
+        if backend not in ("python", "numpy", "maxscore"):
+            raise ValueError(f"Unknown retrieval backend: {backend}")
+        if scoring not in ("cosine", "bm25"):
+            raise ValueError(f"Unknown retrieval scoring: {scoring}")
+        # A versioned index directory is resolved to its published build once, here
+        self.index_dir = current_dir(index_dir)
+        self.loaded_version = index_version(self.index_dir)
+        self.backend = backend
+        self._sparse = None
+        # Candidate runs per filter set; the index is immutable, so entries never expire
+        self._runs = TTLCache(maxsize=FILTER_CACHE_SIZE, ttl=float("inf"))
+        # index.bin is memory-mapped; JSON index directories are still readable
+        self.index = open_index(self.index_dir)
+        self.corpus = self.index.docs
+        self.scoring = scoring
+        index = self.index
+        if scoring == "bm25" and not index.has_bm25:
+            raise ValueError("This index has no BM25 weights; rebuild it with make ingest")
+        if backend == "maxscore" and not index.has_bounds:
+            raise ValueError("This index has no per-term score bounds for maxscore; rebuild it with make ingest")
+        # One weight per posting: cosine divides the dot product by the doc norm, BM25 weights
+        # are summed as they are. bounds[tid] caps a term's contribution per unit query weight.
+        if scoring == "bm25":
+            self.weights, self.norms, self.bounds = index.post_bm25, None, index.bm25_max
+        else:
+            self.weights, self.norms = index.post_weights, index.norms
+            self.bounds = index.term_max if index.has_bounds else None
 
-    def _vectorize_query(self, query: str) -> Dict[str, float]:
+    @property
+    def version(self) -> Tuple[str, int, int]:
+        return index_version(self.index_dir)
+
+    def _vectorize_query(self, query: str) -> Dict[int, float]:
+        # term id -> weight. Terms the index has never seen have zero idf and are dropped,
+        # so each query term is looked up in the vocabulary exactly once. BM25 weighs
+        # query terms by how often they occur; the idf is already in the doc weights.
         toks = tokenize(query)
         tf: Dict[str, int] = {}
         for t in toks:
             tf[t] = tf.get(t, 0) + 1
         max_tf = max(tf.values()) if tf else 1
-        vec: Dict[str, float] = {}
+        index = self.index
+        vec: Dict[int, float] = {}
         for term, cnt in tf.items():
+            tid = index.term_id(term)
+            if tid is None:
+                continue
+            if self.scoring == "bm25":
+                vec[tid] = float(cnt)
+                continue
             tf_weight = 0.5 + 0.5 * (cnt / max_tf)
-            vec[term] = tf_weight * self.idf.get(term, 0.0)
+            vec[tid] = tf_weight * index.idf_values[tid]
         return vec
 
-    def _cosine(self, q: Dict[str, float], d: Dict[str, float]) -> float:
-        # dot
-        dot = 0.0
-        for term, qv in q.items():
-            dv = d.get(term)
-            if dv is not None:
-                dot += qv * dv
-        # norms
-        nq = math.sqrt(sum(v * v for v in q.values())) or 1.0
-        nd = math.sqrt(sum(v * v for v in d.values())) or 1.0
-        return dot / (nq * nd)
-
-    def retrieve(self, query: str, k: int = MAX_DOCS) -> List[Dict[str, Any]]:
-        qvec = self._vectorize_query(query)
-        scores: List[float] = []
-        for dvec in self.vectors:
-            scores.append(self._cosine(qvec, dvec))
-        ranked = sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+    def _candidates(self, filters: Optional[Dict[str, Any]]) -> Optional[Runs]:
+        if not filters:
+            return None
+        if not self.index.has_fields:
+            raise ValueError("This index has no field data for filtering; rebuild it with make ingest")
+        key = filter_key(filters)
+        runs = self._runs.get(key)
+        if runs is None:
+            runs = candidate_runs(self.index, filters)
+            self._runs.set(key, runs)
+        return runs
+
+    def _accumulate(self, dots: Dict[int, float], tid: int, qv: float, runs: Optional[Runs] = None) -> None:
+        # Add term tid's contribution to the dot product of every document in its posting list
+        # (and, with runs, only of docs inside those [start, end) ranges)
+        index = self.index
+        post_docs, weights = index.post_docs, self.weights
+        lo, hi = index.post_ptr[tid], index.post_ptr[tid + 1]
+        if runs is None:
+            for doc_id, dv in zip(post_docs[lo:hi], weights[lo:hi]):
+                dots[doc_id] = dots.get(doc_id, 0.0) + qv * dv
+        elif len(runs) * 16 < hi - lo:
+            # Few runs against a long posting list: jump to each run and scan only inside it
+            pos = lo
+            for start, end in runs:
+                pos = bisect_left(post_docs, start, pos, hi)
+                while pos < hi and post_docs[pos] < end:
+                    doc_id = post_docs[pos]
+                    dots[doc_id] = dots.get(doc_id, 0.0) + qv * weights[pos]
+                    pos += 1
+                if pos == hi:
+                    break
+        else:
+            # Walk the postings and the runs side by side
+            j, num_runs = 0, len(runs)
+            for doc_id, dv in zip(post_docs[lo:hi], weights[lo:hi]):
+                while runs[j][1] <= doc_id:
+                    j += 1
+                    if j == num_runs:
+                        break
+                if j == num_runs:
+                    break
+                if doc_id >= runs[j][0]:
+                    dots[doc_id] = dots.get(doc_id, 0.0) + qv * dv
+
+    def _normalize(self, dots: Dict[int, float], qvec: Dict[int, float]) -> Dict[int, float]:
+        if self.norms is None:
+            return dots
+        nq = math.sqrt(sum(v * v for v in qvec.values())) or 1.0
+        norms = self.norms
+        return {doc_id: dot / (nq * norms[doc_id]) for doc_id, dot in dots.items()}
+
+    def _score(self, qvec: Dict[int, float], runs: Optional[Runs] = None) -> Dict[int, float]:
+        # Accumulate dot products only for documents sharing a term with the query
+        dots: Dict[int, float] = {}
+        for tid, qv in qvec.items():
+            self._accumulate(dots, tid, qv, runs)
+        return self._normalize(dots, qvec)
+
+    def _score_pruned(self, qvec: Dict[int, float], k: int, runs: Optional[Runs] = None) -> Dict[int, float]:
+        # MaxScore, term at a time. Terms go in decreasing order of their largest possible
+        # contribution, qv * bounds[tid] (scores here are dot / doc norm for cosine, the
+        # dot itself for BM25). Once what the remaining terms could add together falls
+        # below the k-th best score so far, a doc none of the scored terms matched can no
+        # longer reach the top k: the remaining posting lists are then only probed for the
+        # docs that still can. Returns the same scores as _score for every doc that can
+        # rank in the top k, and at least k of them whenever k docs match the query.
+        norms, bounds = self.norms, self.bounds
+        terms = sorted(qvec, key=lambda tid: qvec[tid] * bounds[tid], reverse=True)
+        caps = [qvec[tid] * bounds[tid] for tid in terms]
+        left, done = sum(caps), 0.0
+        dots: Dict[int, float] = {}
+
+        def scores() -> List[float]:
+            # Pruning scores of the docs in dots, in dots order
+            if norms is None:
+                return list(dots.values())
+            return list(map(truediv, dots.values(), map(norms.__getitem__, dots)))
+
+        i, theta = 0, None
+        while i < len(terms):
+            self._accumulate(dots, terms[i], qvec[terms[i]], runs)
+            left -= caps[i]
+            done += caps[i]
+            i += 1
+            # No score so far exceeds done, so the k-th best is only worth finding once left is below it
+            if i < len(terms) and len(dots) >= k and left * (1 + _BOUND_SLACK) < done:
+                vals = scores()
+                theta = heapq.nlargest(k, vals)[-1]
+                if left * (1 + _BOUND_SLACK) < theta:
+                    break
+                theta = None
+        if theta is None:
+            return self._normalize(dots, qvec)
+
+        index = self.index
+        ptr, post_docs, weights = index.post_ptr, index.post_docs, self.weights
+        while True:
+            floor = theta * (1 - _BOUND_SLACK) - left * (1 + _BOUND_SLACK)
+            keep = sorted(doc_id for doc_id, v in zip(dots, vals) if v >= floor)
+            dots = {doc_id: dots[doc_id] for doc_id in keep}
+            if i == len(terms):
+                break
+            tid, qv = terms[i], qvec[terms[i]]
+            # Candidates are sorted: only the postings between the first and the last are read
+            lo = bisect_left(post_docs, keep[0], ptr[tid], ptr[tid + 1])
+            hi = bisect_left(post_docs, keep[-1] + 1, lo, ptr[tid + 1])
+            if len(keep) * 16 < hi - lo:
+                # Few candidates against a long posting list: look each one up
+                pos = lo
+                for doc_id in keep:
+                    pos = bisect_left(post_docs, doc_id, pos, hi)
+                    if pos == hi:
+                        break
+                    if post_docs[pos] == doc_id:
+                        dots[doc_id] += qv * weights[pos]
+            else:
+                for doc_id, dv in zip(post_docs[lo:hi], weights[lo:hi]):
+                    if doc_id in dots:
+                        dots[doc_id] += qv * dv
+            left -= caps[i]
+            i += 1
+            vals = scores()
+            theta = heapq.nlargest(k, vals)[-1]
+        return self._normalize(dots, qvec)
+
+    def _top_k(self, scores: Dict[int, float], k: int, runs: Optional[Runs] = None) -> List[Tuple[int, float]]:
+        # Ties break on the lower doc id, matching a stable sort over the whole corpus
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        if len(top) < k:
+            # Documents without a shared term score 0.0 and follow in corpus order
+            for doc_id in (range(len(self.corpus)) if runs is None else iter_docs(runs)):
+                if len(top) >= k:
+                    break
+                if doc_id not in scores:
+                    top.append((doc_id, 0.0))
+        return top
+
+    def _rank(self, qvec: Dict[int, float], k: int, runs: Optional[Runs] = None) -> List[Tuple[int, float]]:
+        if self.backend == "maxscore" and k > 0:
+            return self._top_k(self._score_pruned(qvec, k, runs), k, runs)
+        return self._top_k(self._score(qvec, runs), k, runs)
+
+    def _sparse_scorer(self):
+        if self._sparse is None:
+            # numpy is only needed for this backend
+            from .sparse import SparseScorer
+            self._sparse = SparseScorer(self.index, self.scoring)
+        return self._sparse
+
+    def _docs(self, ranked: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
         results: List[Dict[str, Any]] = []
-        for idx in ranked:
+        for idx, score in ranked:
             doc = self.corpus[idx].copy()
-            doc["score"] = float(scores[idx])
+            doc["score"] = float(score)
             results.append(doc)
-        return results
\ No newline at end of file
+        return results
+
+    def retrieve(self, query: str, k: int = MAX_DOCS, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        # filters narrows the candidate docs before scoring, e.g.
+        # {"district": {"Pune", None}, "dataset": ["weather", "soil"], "date_from": "2025-08-01"}
+        # (see filters.candidate_runs); None inside a value set admits docs without that field.
+        if self.backend == "numpy":
+            return self.retrieve_many([query], k, filters)[0]
+        runs = self._candidates(filters)
+        return self._docs(self._rank(self._vectorize_query(query), k, runs))
+
+    def retrieve_many(self, queries: List[str], k: int = MAX_DOCS,
+                      filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        # One filter set applies to every query in the batch
+        runs = self._candidates(filters)
+        qvecs = [self._vectorize_query(q) for q in queries]
+        if self.backend == "numpy":
+            return [self._docs(ranked) for ranked in self._sparse_scorer().top_k(qvecs, k, runs)]
+        return [self._docs(self._rank(qvec, k, runs)) for qvec in qvecs]
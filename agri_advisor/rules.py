@@ -61,7 +61,11 @@ def when_to_irrigate(weather_rows: List[Dict[str, Any]], soil_row: Optional[Dict
     rain = sum(r["rain_mm"] for r in recent)
     tmax_vals = [r["tmax_c"] for r in recent if r.get("tmax_c") is not None]
     tmax = sum(tmax_vals) / len(tmax_vals) if tmax_vals else None
+    return irrigation_rule(rain, tmax, soil_row)
 
+
+def irrigation_rule(rain: float, tmax: Optional[float], soil_row: Optional[Dict[str, Any]] = None) -> RuleResult:
+    # Messages and confidence from the window aggregates; shared with the bulk advisory path
     msgs: List[str] = []
     conf = 0.5
 
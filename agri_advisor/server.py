@@ -1,20 +1,59 @@
 from __future__ import annotations
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse, RedirectResponse
+import logging
+from typing import Optional
+import asyncio
+import json
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from starlette.staticfiles import StaticFiles
 from pathlib import Path
 
 from .data_models import AskRequest, Answer
 from .advice_engine import AgriAdvisor
-from .config import SAMPLES_DIR
+from .batch import aiter_lines, answer_lines
+from .metrics import REGISTRY
+from .config import SAMPLES_DIR, PREFETCH_ENABLED, WARMUP_ON_STARTUP, INDEX_WATCH_ENABLED, PEST_FEED_ENABLED, PEST_FEED_LIMIT
+from .config import ASK_EXECUTION, ASK_RETRY_AFTER_S
+from .index_versions import IndexWatcher
+from .prefetch import ForecastPrefetcher, districts_from_csv
+from .workers import AnswerPool, Overloaded
+
+log = logging.getLogger(__name__)
 
 app = FastAPI(title="Agri Advisor", version="0.2.0")
 
-advisor = AgriAdvisor(SAMPLES_DIR)
+_advisor: Optional[AgriAdvisor] = None
+_watcher: Optional[IndexWatcher] = None
+_pest_scheduler = None
+
+
+def get_advisor() -> AgriAdvisor:
+    # Built on first use; the startup hook below warms it before traffic when enabled
+    global _advisor
+    if _advisor is None:
+        advisor = AgriAdvisor(SAMPLES_DIR)
+        if PREFETCH_ENABLED:
+            advisor.prefetcher = ForecastPrefetcher(advisor.external, districts_from_csv(SAMPLES_DIR / "soil_types.csv"))
+        _advisor = advisor
+    return _advisor
+
+
+def set_advisor(advisor: AgriAdvisor) -> None:
+    # Serve from a preconfigured advisor (other data/index dirs, stubbed upstreams)
+    global _advisor
+    _advisor = advisor
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Refused before any work was queued, so the client can retry elsewhere or shortly
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(ASK_RETRY_AFTER_S)})
 
 @app.post("/ask", response_model=Answer)
 async def ask(req: AskRequest):
-    res = advisor.ask(req.question, district=req.district, crop=req.crop, lang=req.lang or "en")
+    advisor = get_advisor()
+    res = await advisor.ask_async(req.question, district=req.district, crop=req.crop, lang=req.lang or "en",
+                                  timings=req.timings)
     return JSONResponse(
         content={
             "answer": res.answer,
@@ -26,6 +65,129 @@ async def ask(req: AskRequest):
         }
     )
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    # Same answer as /ask as server-sent events: "hits" (retrieved docs and citations) right
+    # after retrieval, "answer" once forecast or local weather data is in, then "followups"
+    advisor = get_advisor()
+    if advisor.pool is not None:
+        # Admission is decided before the stream starts, so a full pool is a plain 503
+        advisor.pool.check()
+
+    async def events():
+        try:
+            async for event, data in advisor.ask_stream(req.question, district=req.district, crop=req.crop,
+                                                        lang=req.lang or "en", timings=req.timings):
+                yield _sse(event, data)
+        except Exception as exc:
+            log.exception("streamed answer failed")
+            yield _sse("error", {"detail": str(exc)})
+        yield _sse("done", {})
+
+    # no-cache / X-Accel-Buffering keep proxies from holding events back
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class RequestStreamingResponse(StreamingResponse):
+    # The body generator reads the request stream itself, so this response must not also
+    # run StreamingResponse's disconnect listener: both would consume receive() messages.
+    # A client that goes away surfaces as ClientDisconnect from request.stream().
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+@app.post("/ask/batch")
+async def ask_batch(request: Request):
+    # Body: one AskRequest JSON object per line (optional "id"). Response: one JSON
+    # result per line in input order, streamed as batches complete.
+    advisor = get_advisor()
+    if advisor.pool is not None:
+        advisor.pool.check()
+
+    async def body():
+        async for result in answer_lines(advisor, aiter_lines(request.stream())):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return RequestStreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.get("/advisories/irrigation")
+async def irrigation_advisories():
+    # Rules over every district's weather are CPU-bound, so they run off the event loop
+    return {"advisories": await asyncio.to_thread(get_advisor().irrigation_advisories)}
+
+@app.get("/alerts/pests")
+async def pest_alerts(district: Optional[str] = None, crop: Optional[str] = None,
+                      limit: int = Query(PEST_FEED_LIMIT, ge=1, le=10_000)):
+    # Evaluated off the event loop in case the scheduled pass has not run yet
+    return await asyncio.to_thread(get_advisor().pest_alerts, district, crop, limit)
+
+@app.get("/stats/cache")
+async def cache_stats():
+    return {"answers": get_advisor().answers.stats()}
+
+@app.get("/stats/startup")
+async def startup_stats():
+    return get_advisor().startup_timings
+
+@app.get("/stats/workers")
+async def worker_stats():
+    pool = get_advisor().pool
+    return {"execution": "pool" if pool is not None else "inline", **(pool.stats() if pool is not None else {})}
+
+@app.get("/stats/index")
+async def index_stats():
+    retriever = get_advisor().retriever
+    return {"dir": str(retriever.index_dir), "docs": len(retriever.corpus),
+            "reload_ms": get_advisor().startup_timings.get("index_reload_ms")}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format; counters are per process, so scrape each worker
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def warm_up():
+    advisor = get_advisor()
+    if WARMUP_ON_STARTUP:
+        log.info("advisor warm-up: %s", advisor.warm_up())
+    if ASK_EXECUTION not in ("inline", "pool"):
+        raise ValueError(f"Unknown AGRI_ASK_EXECUTION: {ASK_EXECUTION}")
+    if ASK_EXECUTION == "pool" and advisor.pool is None:
+        pool = AnswerPool(advisor)
+        advisor.startup_timings["pool_start_ms"] = await asyncio.to_thread(pool.start)
+        advisor.pool = pool
+        log.info("answer pool ready: %d workers", pool.workers)
+    if advisor.prefetcher is not None:
+        advisor.prefetcher.start()
+    if INDEX_WATCH_ENABLED:
+        # Picks up builds published by make ingest / ingest-update without a restart
+        global _watcher
+        _watcher = IndexWatcher(advisor)
+        _watcher.start()
+    if PEST_FEED_ENABLED:
+        # Re-evaluates every pest rule over all districts when weather data or the rules change
+        from .advisories import PestFeedScheduler
+        global _pest_scheduler
+        _pest_scheduler = PestFeedScheduler(advisor.pest_feed)
+        _pest_scheduler.start()
+
+@app.on_event("shutdown")
+async def close_external_client():
+    if _watcher is not None:
+        await _watcher.stop()
+    if _pest_scheduler is not None:
+        await _pest_scheduler.stop()
+    if _advisor is None:
+        return
+    if _advisor.pool is not None:
+        _advisor.pool.close()
+        _advisor.pool = None
+    if _advisor.prefetcher is not None:
+        await _advisor.prefetcher.stop()
+    await _advisor.external.aclose()
+
 @app.get("/")
 async def root():
     return RedirectResponse(url="/ui/")
@@ -0,0 +1,99 @@
+from __future__ import annotations
+from typing import List, Dict, Optional, Tuple
+import math
+
+import numpy as np
+
+# Upper bound on the dense (queries x docs) score block built per batch
+MAX_BLOCK_CELLS = 1 << 24
+
+
+def _run_ids(runs: List[Tuple[int, int]]) -> np.ndarray:
+    bounds = np.asarray(runs, dtype=np.int64).reshape(-1, 2)
+    lengths = bounds[:, 1] - bounds[:, 0]
+    return np.repeat(bounds[:, 0] - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+
+
+class SparseScorer:
+    def __init__(self, index, scoring: str = "cosine"):
+        # scoring: "cosine" over post_weights, or "bm25" summing post_bm25 as stored
+        self.index = index
+        self.scoring = scoring
+        self.num_docs = n = index.num_docs
+
+        # The index postings already form the term-major (CSC) layout; view them without copying
+        self.t_indptr = np.frombuffer(index.post_ptr, dtype=np.uint64).astype(np.int64)
+        self.t_docs = np.frombuffer(index.post_docs, dtype=np.uint32)
+        if scoring == "bm25":
+            self.t_data = np.frombuffer(index.post_bm25, dtype=np.float32)
+        else:
+            doc_norms = np.frombuffer(index.norms, dtype=np.float64)
+            self.t_data = (np.asarray(index.post_weights, dtype=np.float64) / doc_norms[self.t_docs]).astype(np.float32)
+
+        # Document-major CSR: rows are docs, columns are integer term ids, cosine weights pre-divided by the doc norm
+        term_ids = np.repeat(np.arange(index.num_terms, dtype=np.int32), np.diff(self.t_indptr))
+        order = np.argsort(self.t_docs, kind="stable")
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.t_docs, minlength=n), out=self.indptr[1:])
+        self.indices = term_ids[order]
+        self.data = self.t_data[order]
+
+    def _query_matrix(self, qvecs: List[Dict[int, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # qvecs are term id -> weight, as built by LocalRetriever._vectorize_query
+        rows: List[int] = []
+        cols: List[int] = []
+        vals: List[float] = []
+        qnorms: List[float] = []
+        for qi, qvec in enumerate(qvecs):
+            for tid, qv in qvec.items():
+                if qv:
+                    rows.append(qi)
+                    cols.append(tid)
+                    vals.append(qv)
+            qnorms.append(1.0 if self.scoring == "bm25" else math.sqrt(sum(v * v for v in qvec.values())) or 1.0)
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.asarray(vals, dtype=np.float32),
+            np.asarray(qnorms, dtype=np.float64),
+        )
+
+    def _score_block(self, qvecs: List[Dict[int, float]]) -> np.ndarray:
+        q_rows, q_terms, q_vals, qnorms = self._query_matrix(qvecs)
+        n = self.num_docs
+        starts = self.t_indptr[q_terms]
+        lengths = self.t_indptr[q_terms + 1] - starts
+        total = int(lengths.sum())
+        # Flat positions of every (query term, posting) pair in the term-major arrays
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        gather = offsets + np.arange(total, dtype=np.int64)
+        cells = np.repeat(q_rows, lengths) * n + self.t_docs[gather]
+        prods = self.t_data[gather] * np.repeat(q_vals, lengths)
+        scores = np.bincount(cells, weights=prods, minlength=len(qvecs) * n).reshape(len(qvecs), n)
+        return scores / qnorms[:, None]
+
+    def top_k(self, qvecs: List[Dict[int, float]], k: int,
+              runs: Optional[List[Tuple[int, int]]] = None) -> List[List[Tuple[int, float]]]:
+        # runs: ascending [start, end) doc id ranges to rank among (None = every doc)
+        out: List[List[Tuple[int, float]]] = []
+        cols = None if runs is None else _run_ids(runs)
+        n = self.num_docs if cols is None else len(cols)
+        k = min(k, n)
+        if k <= 0 or n == 0:
+            return [[] for _ in qvecs]
+        step = max(1, MAX_BLOCK_CELLS // self.num_docs)
+        for start in range(0, len(qvecs), step):
+            block = self._score_block(qvecs[start:start + step])
+            if cols is not None:
+                block = block[:, cols]
+            for row in block:
+                part = np.argpartition(-row, k - 1)[:k]
+                threshold = row[part].min()
+                # Keep the lowest doc ids among ties at the cut-off, like the pure-Python path
+                above = np.flatnonzero(row > threshold)
+                ties = np.flatnonzero(row == threshold)[: k - len(above)]
+                sel = np.concatenate((above, ties))
+                sel = sel[np.lexsort((sel, -row[sel]))]
+                ids = sel if cols is None else cols[sel]
+                out.append([(int(d), float(row[i])) for d, i in zip(ids, sel)])
+        return out
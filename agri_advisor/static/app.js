@@ -11,12 +11,77 @@ async function postJSON(url, data){
   return await r.json();
 }
 
+// POST to an SSE endpoint and call onEvent(event, data) per message as it arrives.
+// EventSource only does GET, so the stream is read and split by hand.
+async function postEvents(url, data, onEvent){
+  const r = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+    body: JSON.stringify(data)
+  });
+  if(!r.ok){
+    const t = await r.text();
+    throw new Error(`Request failed: ${r.status} ${t}`);
+  }
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for(;;){
+    const { value, done } = await reader.read();
+    if(done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while((sep = buf.indexOf('\n\n')) >= 0){
+      const frame = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = 'message';
+      const lines = [];
+      frame.split('\n').forEach(line => {
+        if(line.startsWith('event:')) event = line.slice(6).trim();
+        else if(line.startsWith('data:')) lines.push(line.slice(5).trimStart());
+      });
+      if(lines.length) onEvent(event, JSON.parse(lines.join('\n')));
+    }
+  }
+}
+
 const form = document.getElementById('ask-form');
 const result = document.getElementById('result');
 const answer = document.getElementById('answer');
 const confidence = document.getElementById('confidence');
 const reasons = document.getElementById('reasons');
 const citations = document.getElementById('citations');
+const followups = document.getElementById('followups');
+
+function renderList(el, items){
+  el.innerHTML = '';
+  (items || []).forEach(t => {
+    const li = document.createElement('li'); li.textContent = t; el.appendChild(li);
+  });
+}
+
+function renderCitations(items){
+  citations.innerHTML = '';
+  (items || []).forEach(c => {
+    const li = document.createElement('li');
+    const src = c.source || 'source';
+    const ds = c.dataset || 'dataset';
+    if(c.url){
+      const a = document.createElement('a'); a.href = c.url; a.target = '_blank'; a.rel = 'noopener'; a.textContent = `${ds} (${src})`;
+      li.appendChild(a);
+    } else {
+      li.textContent = `${ds} (${src})`;
+    }
+    citations.appendChild(li);
+  });
+}
+
+function renderAnswer(res){
+  answer.textContent = res.answer || '';
+  confidence.textContent = (res.confidence != null ? res.confidence.toFixed(2): '');
+  renderList(reasons, res.reasons);
+  renderCitations(res.citations);
+}
 
 form.addEventListener('submit', async (e) => {
   e.preventDefault();
@@ -26,33 +91,35 @@ form.addEventListener('submit', async (e) => {
     crop: document.getElementById('crop').value || null,
     lang: document.getElementById('lang').value || 'en'
   };
+  result.classList.remove('hidden');
+  answer.textContent = 'Searching local data…';
+  confidence.textContent = '';
+  reasons.innerHTML = '';
+  citations.innerHTML = '';
+  followups.innerHTML = '';
   try{
-    const res = await postJSON('/ask', data);
-    result.classList.remove('hidden');
-    answer.textContent = res.answer || '';
-    confidence.textContent = (res.confidence != null ? res.confidence.toFixed(2): '');
-    reasons.innerHTML = '';
-    (res.reasons || []).forEach(r => {
-      const li = document.createElement('li'); li.textContent = r; reasons.appendChild(li);
-    });
-    citations.innerHTML = '';
-    (res.citations || []).forEach(c => {
-      const li = document.createElement('li');
-      const src = c.source || 'source';
-      const ds = c.dataset || 'dataset';
-      if(c.url){
-        const a = document.createElement('a'); a.href = c.url; a.target = '_blank'; a.rel = 'noopener'; a.textContent = `${ds} (${src})`;
-        li.appendChild(a);
-      } else {
-        li.textContent = `${ds} (${src})`;
-      }
-      citations.appendChild(li);
-    });
+    if(window.ReadableStream && window.TextDecoder){
+      await postEvents('/ask/stream', data, (event, payload) => {
+        if(event === 'hits'){
+          renderCitations(payload.citations);
+          answer.textContent = 'Found sources; preparing the answer…';
+        } else if(event === 'answer'){
+          renderAnswer(payload);
+        } else if(event === 'followups'){
+          renderList(followups, payload.followups);
+        } else if(event === 'error'){
+          throw new Error(payload.detail || 'stream failed');
+        }
+      });
+    } else {
+      const res = await postJSON('/ask', data);
+      renderAnswer(res);
+      renderList(followups, res.followups);
+    }
   }catch(err){
-    result.classList.remove('hidden');
     answer.textContent = `Error: ${err.message}`;
     confidence.textContent = '';
     reasons.innerHTML = '';
     citations.innerHTML = '';
   }
-});
\ No newline at end of file
+});
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left, bisect_right
+import csv
+from datetime import datetime, timedelta
+import math
+from pathlib import Path
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _opt_float(value: Optional[str]) -> float:
+    try:
+        return float(value or "")
+    except ValueError:
+        return math.nan
+
+
+class WeatherSeries:
+    # One district's observations as date-sorted columns
+    def __init__(self, district: str, rows: List[Tuple[datetime, float, float, float, float]]):
+        rows.sort(key=lambda r: r[0])
+        self.district = district
+        self.dates: List[datetime] = [r[0] for r in rows]
+        self.ordinals = array("l", (d.toordinal() for d in self.dates))
+        self.rain_mm = array("d", (r[1] for r in rows))
+        self.tmax_c = array("d", (r[2] for r in rows))
+        self.tmin_c = array("d", (r[3] for r in rows))
+        self.humidity_pct = array("d", (r[4] for r in rows))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def _rows(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        return [
+            {"date": self.dates[i], "rain_mm": self.rain_mm[i], "tmax_c": self.tmax_c[i]}
+            for i in range(lo, hi)
+        ]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self._rows(0, len(self.dates))
+
+    def range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        # Inclusive date range; either bound may be open
+        lo = bisect_left(self.dates, start) if start is not None else 0
+        hi = bisect_right(self.dates, end) if end is not None else len(self.dates)
+        return self._rows(lo, hi)
+
+    def window(self, days: int) -> List[Dict[str, Any]]:
+        # Rows on or after (latest date - days), the window when_to_irrigate looks at
+        if not self.dates:
+            return []
+        return self.range(self.dates[-1] - timedelta(days=days))
+
+    def last_n_days(self, n: int) -> List[Dict[str, Any]]:
+        return self.window(n - 1) if n > 0 else []
+
+
+class RulesDataStore:
+    # Weather and soil CSVs loaded once and keyed by lower-cased district. Each read
+    # stats the two files and reloads when their mtime/size (the version) changes.
+    def __init__(self, data_dir: Path, weather_file: str = "weather_sample.csv", soil_file: str = "soil_types.csv"):
+        self.weather_path = Path(data_dir) / weather_file
+        self.soil_path = Path(data_dir) / soil_file
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[Any, ...]] = None
+        self._weather: Dict[str, WeatherSeries] = {}
+        self._all_weather: List[Dict[str, Any]] = []
+        self._soil: Dict[str, Dict[str, Any]] = {}
+        self._first_soil: Optional[Dict[str, Any]] = None
+
+    def _stat(self, path: Path) -> Tuple[int, int]:
+        try:
+            st = path.stat()
+        except OSError:
+            return (-1, -1)
+        return (st.st_mtime_ns, st.st_size)
+
+    @property
+    def version(self) -> Tuple[Any, ...]:
+        return (self._stat(self.weather_path), self._stat(self.soil_path))
+
+    def _ensure_loaded(self) -> None:
+        version = self.version
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._load_weather()
+            self._load_soil()
+            self._version = version
+
+    def _load_weather(self) -> None:
+        by_district: Dict[str, List[Tuple[datetime, float, float, float, float]]] = {}
+        names: Dict[str, str] = {}
+        all_rows: List[Dict[str, Any]] = []
+        try:
+            with self.weather_path.open("r", newline="", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    try:
+                        row = (
+                            datetime.fromisoformat(r.get("date", "1970-01-01")),
+                            float(r.get("rain_mm", 0) or 0),
+                            float(r.get("tmax_c", 0) or 0),
+                            _opt_float(r.get("tmin_c")),
+                            _opt_float(r.get("humidity_pct")),
+                        )
+                    except Exception:
+                        continue
+                    district = r.get("district", "")
+                    key = district.lower()
+                    names.setdefault(key, district)
+                    by_district.setdefault(key, []).append(row)
+                    all_rows.append({"date": row[0], "rain_mm": row[1], "tmax_c": row[2]})
+        except Exception:
+            by_district, all_rows = {}, []
+        self._weather = {key: WeatherSeries(names[key], rows) for key, rows in by_district.items()}
+        self._all_weather = all_rows
+
+    def _load_soil(self) -> None:
+        soil: Dict[str, Dict[str, Any]] = {}
+        first: Optional[Dict[str, Any]] = None
+        try:
+            with self.soil_path.open("r", newline="", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    whc = None
+                    try:
+                        whc = float(r.get("whc_mm", "") or "")
+                    except Exception:
+                        pass
+                    row = {"whc_mm": whc, "soil_texture": r.get("soil_texture", "")}
+                    if first is None:
+                        first = row
+                    # First row wins, as with rules.parse_soil
+                    soil.setdefault(r.get("district", "").lower(), row)
+        except Exception:
+            soil, first = {}, None
+        self._soil = soil
+        self._first_soil = first
+
+    def all_series(self) -> List[WeatherSeries]:
+        self._ensure_loaded()
+        return list(self._weather.values())
+
+    def districts(self) -> List[str]:
+        self._ensure_loaded()
+        return [series.district for series in self._weather.values()]
+
+    def weather(self, district: str) -> Optional[WeatherSeries]:
+        self._ensure_loaded()
+        return self._weather.get(district.lower())
+
+    def weather_rows(self, district: Optional[str]) -> List[Dict[str, Any]]:
+        # Same rows rules.parse_weather returns (date-sorted rather than file order)
+        self._ensure_loaded()
+        if not district:
+            return list(self._all_weather)
+        series = self._weather.get(district.lower())
+        return series.rows() if series is not None else []
+
+    def window(self, district: Optional[str], days: int) -> List[Dict[str, Any]]:
+        if not district:
+            rows = self.weather_rows(None)
+            if not rows:
+                return []
+            start = max(r["date"] for r in rows) - timedelta(days=days)
+            return [r for r in rows if r["date"] >= start]
+        series = self.weather(district)
+        return series.window(days) if series is not None else []
+
+    def last_n_days(self, district: str, n: int) -> List[Dict[str, Any]]:
+        series = self.weather(district)
+        return series.last_n_days(n) if series is not None else []
+
+    def range(self, district: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        series = self.weather(district)
+        return series.range(start, end) if series is not None else []
+
+    def soil(self, district: Optional[str]) -> Optional[Dict[str, Any]]:
+        # Same semantics as rules.parse_soil
+        self._ensure_loaded()
+        if not district:
+            return dict(self._first_soil) if self._first_soil is not None else None
+        row = self._soil.get(district.lower())
+        return dict(row) if row is not None else None
@@ -0,0 +1,65 @@
+from __future__ import annotations
+from array import array
+from collections import Counter
+from datetime import date
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Runs of letters/digits: the same tokens as an isalnum() scan, found by the regex engine in C
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def field_value(field: str, value: Any) -> Optional[str]:
+    # Canonical form of a filterable field value (see index_format.FIELDS): dates as
+    # YYYY-MM-DD, everything else case- and whitespace-folded. None if unusable.
+    if value is None:
+        return None
+    if field == "date":
+        if isinstance(value, date):
+            return value.isoformat()[:10]
+        try:
+            return date.fromisoformat(str(value).strip()[:10]).isoformat()
+        except ValueError:
+            return None
+    norm = " ".join(str(value).split()).casefold()
+    return norm or None
+
+
+class Vocabulary:
+    # Term <-> dense integer id, ids assigned in first-seen order. Documents are kept
+    # as parallel term-id / count arrays instead of one str-keyed dict each.
+    def __init__(self, terms: Iterable[str] = ()):
+        self.terms: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for term in terms:
+            self.add(term)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def add(self, term: str) -> int:
+        tid = self._ids.get(term)
+        if tid is None:
+            tid = self._ids[term] = len(self.terms)
+            self.terms.append(term)
+        return tid
+
+    def get(self, term: str) -> Optional[int]:
+        return self._ids.get(term)
+
+    def count(self, tokens: Iterable[str], add: bool = True) -> Tuple[array, array]:
+        # -> (term ids, counts) for one document, ids in first-occurrence order.
+        # With add=False unknown terms are dropped instead of joining the vocabulary.
+        tf = Counter(tokens)
+        ids = self._ids
+        if add:
+            for term in tf:
+                if term not in ids:
+                    self.add(term)
+        elif not all(term in ids for term in tf):
+            tf = Counter({term: n for term, n in tf.items() if term in ids})
+        return array("I", map(ids.__getitem__, tf)), array("I", tf.values())
@@ -0,0 +1,127 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from pathlib import Path
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import ASK_QUEUE_LIMIT, ASK_WORKERS
+from .metrics import ASK_REJECTED, StageTimer
+
+# The advisor of this worker process, built by _init_worker
+_advisor = None
+
+
+def _init_worker(data_dir: Path, index_dir: Path, backend: str, scoring: str) -> None:
+    # Every worker maps the same index.bin, so the index pages are shared through the
+    # page cache rather than copied per process
+    global _advisor
+    from .advice_engine import AgriAdvisor
+    _advisor = AgriAdvisor(data_dir, backend=backend, index_dir=index_dir, scoring=scoring)
+    _advisor.warm_up()
+
+
+def _warm() -> int:
+    # Held long enough that one worker cannot take every warm-up task
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _prepare(question: str, district: Optional[str], crop: Optional[str], lang: str):
+    # Picks up a newly published index version before answering, like IndexWatcher does
+    _advisor.reload_index()
+    timer = StageTimer()
+    res, hits = _advisor.prepare(question, district, crop, lang, timer)
+    return res, hits, timer.stages
+
+
+def _prepare_many(items: List[Tuple[str, Optional[str], Optional[str], str]]):
+    _advisor.reload_index()
+    timer = StageTimer()
+    return _advisor.prepare_many(items, timer), timer.stages
+
+
+def _irrigation_answer(district: Optional[str], daily: Optional[List[Dict[str, Any]]], docs: List[Dict[str, Any]],
+                       citations: List[Dict[str, Any]], stale: bool):
+    timer = StageTimer()
+    res = _advisor._irrigation_answer(district, daily, docs, citations, stale, timer)
+    return res, timer.stages
+
+
+class Overloaded(RuntimeError):
+    # The pool already holds as many answers as it admits; the server replies 503
+    pass
+
+
+class AnswerPool:
+    # Runs the CPU-bound part of an answer or an /ask/batch chunk (language detection,
+    # retrieval, price store, irrigation rules over the weather CSVs) in pre-warmed worker
+    # processes, so it no longer blocks the event loop and scales with cores. Forecast
+    # I/O and the answer cache stay in the server process. At most workers + queue_limit
+    # answers are admitted; past that, requests fail at once with Overloaded instead of
+    # queueing.
+    def __init__(self, advisor, workers: int = ASK_WORKERS, queue_limit: int = ASK_QUEUE_LIMIT):
+        self.initargs = (advisor.data_dir, advisor.index_dir, advisor.backend, advisor.scoring)
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_limit
+
+    def start(self) -> float:
+        # Blocks until every worker has loaded the index, data store and langid; -> ms taken.
+        # Workers are spawned, not forked, so they inherit no event loop or threads.
+        t0 = time.perf_counter()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=self.initargs)
+        ready = set()
+        while len(ready) < self.workers:
+            ready.update(f.result() for f in [self._executor.submit(_warm) for _ in range(self.workers)])
+        return (time.perf_counter() - t0) * 1000
+
+    def check(self) -> None:
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            ASK_REJECTED.inc()
+            raise Overloaded(f"{self.in_flight} answers in progress; try again shortly")
+
+    async def _run(self, fn: Callable[..., Any], *args: Any, admit: bool = True) -> Any:
+        # admit=False is for the later steps of an answer that was already admitted
+        if self._executor is None:
+            raise RuntimeError("AnswerPool.start() has not been called")
+        if admit:
+            self.check()
+        self.in_flight += 1
+        try:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self.in_flight -= 1
+
+    async def prepare(self, question: str, district: Optional[str], crop: Optional[str], lang: str):
+        # -> (price answer or None, (docs, citations) or None, stage seconds); see AgriAdvisor.prepare
+        return await self._run(_prepare, question, district, crop, lang)
+
+    async def prepare_many(self, items: List[Tuple[str, Optional[str], Optional[str], str]]):
+        # -> (AgriAdvisor.prepare_many result, stage seconds). The server admits an /ask/batch
+        # request once, before its response starts; its chunks then count as in flight but
+        # are not refused halfway through the response
+        return await self._run(_prepare_many, items, admit=False)
+
+    async def irrigation_answer(self, district: Optional[str], daily: Optional[List[Dict[str, Any]]],
+                                docs: List[Dict[str, Any]], citations: List[Dict[str, Any]], stale: bool):
+        return await self._run(_irrigation_answer, district, daily, docs, citations, stale, admit=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "capacity": self.capacity, "in_flight": self.in_flight,
+                "rejected": self.rejected}
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
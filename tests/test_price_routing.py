@@ -0,0 +1,33 @@
+import pytest
+
+from agri_advisor.advice_engine import AgriAdvisor
+from agri_advisor.config import INDEX_DIR, SAMPLES_DIR
+from agri_advisor.metrics import StageTimer
+
+
+@pytest.fixture(scope="module")
+def advisor():
+    return AgriAdvisor(SAMPLES_DIR, index_dir=INDEX_DIR)
+
+
+@pytest.mark.parametrize("question, crop", [
+    ("What is the seed rate for wheat?", None),
+    ("Which market sells rice seed?", None),
+    ("When should I irrigate? Market prices are low", "Wheat"),
+])
+def test_non_price_questions_skip_the_price_store(advisor, question, crop):
+    res, hits = advisor.prepare(question, None, crop, "en", StageTimer())
+    assert res is None
+    assert hits is not None
+
+
+@pytest.mark.parametrize("question, crop", [
+    ("wheat price trend", None),
+    ("mandi rate", "Wheat"),
+    ("market rate of wheat", None),
+    ("गेहूं का भाव", "Wheat"),
+])
+def test_price_questions_use_the_price_store(advisor, question, crop):
+    res, hits = advisor.prepare(question, None, crop, "en", StageTimer())
+    assert hits is None
+    assert res.citations[0]["dataset"] == "mandi_prices"
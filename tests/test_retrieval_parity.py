@@ -0,0 +1,66 @@
+import pytest
+
+from agri_advisor.bench import BASE_CROPS, district_names, generate_datasets, make_questions
+from agri_advisor.data_ingestion import DATASETS, row_fields, update_index
+from agri_advisor.retriever import LocalRetriever
+from agri_advisor.text import field_value
+
+ROWS = 3000
+K = 5
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp("parity")
+    generate_datasets(root / "data", ROWS)
+    update_index(root / "data", root / "index", workers=1)
+    return root / "index"
+
+
+def _questions():
+    return [(f"{q} | district: {d} | crop: {c}", d, c) for q, d, c, _ in make_questions(40, district_names(ROWS))]
+
+
+def _filter_sets():
+    yield None
+    yield {"district": {"Indore", None}}
+    yield {"district": {"Pune", None}, "crop": {"Wheat", None}}
+    yield {"crop": [BASE_CROPS[2]], "dataset": ["mandi_prices", "pest_alerts"]}
+
+
+def _ids(hits):
+    return [(h["__dataset"], h["__id"]) for h in hits]
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "bm25"])
+@pytest.mark.parametrize("backend", ["numpy", "maxscore"])
+def test_backends_rank_like_exhaustive_python(index_dir, scoring, backend):
+    reference = LocalRetriever(index_dir, backend="python", scoring=scoring)
+    other = LocalRetriever(index_dir, backend=backend, scoring=scoring)
+    for filters in _filter_sets():
+        for query, _, _ in _questions():
+            expected, got = reference.retrieve(query, K, filters), other.retrieve(query, K, filters)
+            assert _ids(got) == _ids(expected), (query, filters)
+            assert [h["score"] for h in got] == pytest.approx([h["score"] for h in expected], abs=1e-6)
+
+
+def _matches(doc, filters):
+    # Recovers the doc's fields from its text, which joins every text field with " | "
+    meta = DATASETS[doc["__dataset"]]
+    fields = row_fields(meta, dict(zip(meta["text_fields"], doc["__text"].split(" | "))))
+    for name, allowed in filters.items():
+        value = doc["__dataset"] if name == "dataset" else fields.get(name)
+        if value not in {None if v is None else field_value(name, v) for v in allowed}:
+            return False
+    return True
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "bm25"])
+def test_filtered_retrieval_is_exact(index_dir, scoring):
+    # A filtered top k equals the whole ranking restricted to the docs the filter admits
+    retriever = LocalRetriever(index_dir, backend="python", scoring=scoring)
+    num_docs = len(retriever.corpus)
+    for filters in list(_filter_sets())[1:]:
+        for query, _, _ in _questions()[:10]:
+            full = [h for h in retriever.retrieve(query, num_docs) if _matches(h, filters)]
+            assert _ids(retriever.retrieve(query, K, filters)) == _ids(full[:K]), (query, filters)